@@ -1,19 +1,47 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 import os
-import base64
+import asyncio
+import csv
+import io
 import json
-from typing import List
+import zlib
+from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import logging
+import threading
+import time
 from dotenv import load_dotenv
 import uuid
 
 load_dotenv()
 
+from app.services import SERVICE_CONFIG, gemini, metrics
+from app.services.analytics import NUMPY_AVAILABLE, AnalyticsCache
+from app.services.barcodes import DECODER_AVAILABLE, ProductCatalog, UncodedBoxes, apply_unit_counts, read_medications
+from app.services.cache import AnalysisCache
+from app.services.cascade import CascadeStats, escalation_reason
+from app.services.coalescer import RequestCoalescer
+from app.services.images import preprocess_image, preprocessing_stats
+from app.services.json_stream import MedicationStreamParser
+from app.services.jobs import AnalysisJob, JobQueue, QueueFull, TERMINAL_STATUSES
+from app.services.singleflight import SingleFlight
+from app.services.storage import create_store
+from app.services.uploads import UploadLimitMiddleware, UploadTooLarge, read_upload
+
 app = FastAPI(title="PharmStock Backend", version="1.0.0")
 
+# Corps de requête bornés pendant la réception : une image (plus l'enveloppe
+# multipart) par requête, UPLOAD_MAX_REQUEST_BYTES pour l'envoi par lot.
+# Ajouté avant CORS, donc à l'intérieur : les 413 portent aussi les en-têtes CORS
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_body=SERVICE_CONFIG["image"]["max_size"] + 64 * 1024,
+    limits={"/analyze-medications/batch": SERVICE_CONFIG["image"]["max_request_size"]}
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -25,21 +53,37 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("pharmstock")
 
-# Configuration Gemini
-try:
-    import google.generativeai as genai
-    API_KEY = os.getenv("GEMINI_API_KEY")
-    if API_KEY:
-        genai.configure(api_key=API_KEY)
-        GEMINI_AVAILABLE = True
-    else:
+# Configuration Gemini (FAST_STARTUP=1 : SDK importé au premier appel)
+API_KEY = os.getenv("GEMINI_API_KEY")
+genai = None
+if SERVICE_CONFIG["startup"]["lazy"]:
+    GEMINI_AVAILABLE = bool(API_KEY) and gemini.sdk_available()
+else:
+    try:
+        genai = gemini.load_sdk(API_KEY)
+        GEMINI_AVAILABLE = bool(API_KEY)
+    except Exception as e:
+        logger.error(f"Erreur Gemini: {e}")
         GEMINI_AVAILABLE = False
-except Exception as e:
-    logger.error(f"Erreur Gemini: {e}")
-    GEMINI_AVAILABLE = False
 
-# Stockage en mémoire (pour la demo)
-medications_storage = []
+genai_lock = threading.Lock()
+
+def load_genai():
+    """SDK Gemini, importé et configuré une seule fois à la première utilisation"""
+    global genai
+    with genai_lock:
+        if genai is None:
+            genai = gemini.load_sdk(API_KEY)
+    return genai
+
+def get_model(model_name=None):
+    return gemini.get_model(load_genai().GenerativeModel, model_name or MODEL_NAME)
+
+async def get_model_async(model_name=None):
+    """Comme get_model, mais le premier import du SDK (plus d'une seconde) se fait hors de la boucle"""
+    if genai is None:
+        await asyncio.get_running_loop().run_in_executor(None, load_genai)
+    return get_model(model_name)
 
 class MedicationInfo(BaseModel):
     id: str
@@ -61,6 +105,117 @@ class StorageResponse(BaseModel):
     medications: List[MedicationInfo]
     total_count: int
     total_units: int
+    next_cursor: Optional[int] = None
+
+class ExpiringMedication(MedicationInfo):
+    expiry: date
+    expiry_precision: str
+    days_left: int
+
+class MedicationChange(BaseModel):
+    version: int
+    op: str
+    medications: List[MedicationInfo]
+
+class ChangesResponse(BaseModel):
+    version: int
+    instance_id: str
+    reset: bool
+    changes: List[MedicationChange]
+
+class StockLine(BaseModel):
+    nom: str
+    laboratoire: str
+    numero_lot: str
+    scans: int
+    total_units: int
+
+class LaboratoryStock(BaseModel):
+    laboratoire: str
+    lines: int
+    scans: int
+    total_units: int
+
+class StockResponse(BaseModel):
+    lines: List[StockLine]
+    laboratories: List[LaboratoryStock]
+    total_lines: int
+    total_units: int
+
+class ExpiringResponse(BaseModel):
+    medications: List[ExpiringMedication]
+    total_count: int
+    total_units: int
+    within_days: int
+
+class LaboratoryAnalytics(BaseModel):
+    laboratoire: str
+    scans: int
+    total_units: int
+    mean_confidence: float
+    low_confidence_scans: int
+
+class ConfidenceBin(BaseModel):
+    min: float
+    max: float
+    scans: int
+    total_units: int
+
+class LowConfidence(BaseModel):
+    threshold: float
+    scans: int
+    total_units: int
+    share: float
+
+class ExpiryMonth(BaseModel):
+    month: str
+    scans: int
+    total_units: int
+    expired: bool
+
+class AnalyticsResponse(BaseModel):
+    version: int
+    scans: int
+    total_units: int
+    laboratories: List[LaboratoryAnalytics]
+    confidence_histogram: List[ConfidenceBin]
+    low_confidence: LowConfidence
+    expiry_months: List[ExpiryMonth]
+    expired_scans: int
+    expired_units: int
+    unreadable_expiry: int
+
+# Stockage indexé par session : mémoire (demo) ou SQLite (STORAGE_BACKEND=sqlite)
+medications_storage = create_store(MedicationInfo)
+
+startup_state = {"lazy": SERVICE_CONFIG["startup"]["lazy"], "warmed_up": False}
+
+def warm_up():
+    """Charge le SDK, le client Gemini et Pillow avant la première requête"""
+    start = time.perf_counter()
+    if GEMINI_AVAILABLE:
+        get_model()
+    from PIL import Image  # noqa: F401
+    startup_state["warmed_up"] = True
+    logger.info(f"Préchauffage terminé en {time.perf_counter() - start:.2f}s")
+
+async def warm_up_in_background():
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    except Exception as e:
+        logger.error(f"Préchauffage impossible: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    analysis_jobs.start()
+    if SERVICE_CONFIG["startup"]["warmup"]:
+        # En tâche de fond : /health répond sans attendre la fin du préchauffage
+        app.state.warmup = asyncio.create_task(warm_up_in_background())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await analysis_jobs.stop()
+    gemini.shutdown()
 
 @app.get("/")
 async def root():
@@ -68,7 +223,7 @@ async def root():
         "message": "PharmStock Backend API", 
         "version": "1.0.0", 
         "gemini_available": GEMINI_AVAILABLE,
-        "total_medications": len(medications_storage)
+        "total_medications": await medications_storage.run(len, medications_storage)
     }
 
 @app.get("/health")
@@ -77,23 +232,40 @@ async def health_check():
         "status": "healthy", 
         "timestamp": datetime.now().isoformat(),
         "gemini_available": GEMINI_AVAILABLE,
-        "stored_medications": len(medications_storage)
+        "stored_medications": await medications_storage.run(len, medications_storage),
+        "analysis_cache": analysis_cache.stats(),
+        "image_preprocessing": preprocessing_stats,
+        "analytics_cache": analytics_cache.stats(),
+        "cascade": {"enabled": CASCADE["enabled"], **cascade_stats.stats()},
+        "barcodes": {"enabled": BARCODES["enabled"], "decoder_available": DECODER_AVAILABLE,
+                     "products": len(product_catalog)},
+        "jobs": {"queue_depth": analysis_jobs.depth, "workers": analysis_jobs.workers},
+        "single_flight": {"enabled": SERVICE_CONFIG["single_flight"]["enabled"], **single_flight.stats()},
+        "startup": {**startup_state, "gemini_sdk_loaded": genai is not None},
+        "gemini": {"concurrency_limit": round(gemini.get_concurrency().limit, 2),
+                   "in_flight": gemini.get_concurrency().in_flight}
     }
 
-@app.post("/analyze-medication", response_model=AnalysisResponse)
-async def analyze_medication(file: UploadFile = File(...), session_id: str = "default"):
-    try:
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Le fichier doit être une image")
-        
-        if not GEMINI_AVAILABLE:
-            raise HTTPException(status_code=503, detail="Service Gemini non disponible")
-        
-        image_data = await file.read()
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        
-        # Prompt amélioré pour mieux détecter le numéro de lot
-        prompt = """
+# Valeurs lues au moment du scrape
+metrics.Gauge("pharmstock_stored_medications", "Médicaments stockés", lambda: len(medications_storage))
+metrics.Gauge("pharmstock_gemini_concurrency_limit", "Limite AIMD des appels Gemini simultanés", lambda: gemini.get_concurrency().limit)
+metrics.Gauge("pharmstock_cascade_latency_saved_seconds", "Latence économisée par la cascade (estimation)", lambda: cascade_stats.latency_saved())
+metrics.Gauge("pharmstock_job_queue_depth", "Jobs d'analyse en attente", lambda: analysis_jobs.depth)
+metrics.Gauge("pharmstock_analysis_cache_hits_total", "Analyses servies par le cache", lambda: analysis_cache.hits, "counter")
+metrics.Gauge("pharmstock_analysis_cache_misses_total", "Analyses absentes du cache", lambda: analysis_cache.misses, "counter")
+metrics.Gauge("pharmstock_image_bytes_in_total", "Octets des images avant prétraitement", lambda: preprocessing_stats["bytes_in"], "counter")
+metrics.Gauge("pharmstock_image_bytes_out_total", "Octets des images après prétraitement", lambda: preprocessing_stats["bytes_out"], "counter")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Métriques au format texte Prometheus"""
+    # Les jauges lisent le stockage : avec SQLite, rendu hors de la boucle
+    return PlainTextResponse(await medications_storage.run(metrics.render), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Prompt amélioré pour mieux détecter le numéro de lot
+# Incrémenter PROMPT_VERSION à chaque modification : la version fait partie de la clé du cache
+PROMPT_VERSION = "2"
+ANALYSIS_PROMPT = """
         Analyse cette image de médicaments pharmaceutiques et extrais les informations suivantes pour chaque médicament visible :
         
         1. Nom du médicament (avec dosage si visible)
@@ -122,97 +294,803 @@ async def analyze_medication(file: UploadFile = File(...), session_id: str = "de
             ]
         }
         """
-        
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        image_part = {"mime_type": file.content_type, "data": image_base64}
+# Variante multi-images utilisée par le regroupement des envois (GEMINI_COALESCE_WINDOW_MS)
+BATCH_PROMPT = ANALYSIS_PROMPT.replace(
+    "Analyse cette image de médicaments",
+    "Tu reçois plusieurs images numérotées (\"Image 1\", \"Image 2\", ...). Analyse chaque image de médicaments séparément"
+).replace(
+    """Retourne UNIQUEMENT un JSON valide :
+        {
+            "medications": [""",
+    """Retourne UNIQUEMENT un JSON valide, avec une entrée par image dans l'ordre :
+        {"images": [{"image": numéro_de_l_image, "medications": [...]}]}
+        où chaque liste "medications" a ce format :
+        {
+            "medications": ["""
+)
+# Premier passage de la cascade (GEMINI_CASCADE=1) : image réduite, consigne courte
+FAST_PROMPT = """
+        Liste chaque médicament visible sur la photo : nom avec dosage, laboratoire,
+        date de péremption (DD/MM/YYYY), numéro de lot ("Non lisible" si illisible),
+        unités restantes, et ta confiance entre 0 et 1.
+        Retourne UNIQUEMENT un JSON valide :
+        {"medications": [{"nom": "...", "laboratoire": "...", "date_peremption": "DD/MM/YYYY",
+        "numero_lot": "...", "nombre_unites": nombre_entier, "confiance": score_entre_0_et_1}]}
+        """
+# Boîtes identifiées par leur code GS1 : seules les unités restent à lire sur la photo
+COUNT_PROMPT = """
+        Les boîtes de médicaments de cette photo ont été identifiées par leur code :
+{boxes}
+        Pour chaque boîte, dans le même ordre, compte les unités encore présentes
+        (ignore les cases vides) et donne ta confiance entre 0 et 1.
+        Compte aussi les boîtes de médicaments visibles qui ne sont pas dans cette liste.
+        Retourne UNIQUEMENT un JSON valide :
+        {{"boites": [{{"nombre_unites": nombre_entier, "confiance": score_entre_0_et_1}}],
+        "autres_boites": nombre_entier}}
+        """
+MODEL_NAME = SERVICE_CONFIG["gemini"]["model_name"]
+CASCADE = SERVICE_CONFIG["cascade"]
+BARCODES = SERVICE_CONFIG["barcodes"]
+
+# Présentations connues de la lecture locale des codes GS1 (BARCODE_FAST_PATH=1)
+product_catalog = ProductCatalog.load(BARCODES["products_path"]) if BARCODES["enabled"] else ProductCatalog()
+
+# Cache des extractions pour les photos renvoyées à l'identique
+analysis_cache = AnalysisCache(**SERVICE_CONFIG["cache"])
+
+def parse_model_response(response_text):
+    """Extrait la liste brute des médicaments du JSON renvoyé par Gemini"""
+    # Lecture limitée au tableau "medications" : le texte libre autour est ignoré
+    parser = MedicationStreamParser()
+    medications = parser.feed(response_text)
+    if parser.found:
+        return medications
+    
+    json_start = response_text.find('{')
+    json_end = response_text.rfind('}') + 1
+    
+    if json_start == -1 or json_end <= json_start:
+        raise HTTPException(status_code=500, detail="Réponse invalide de l'IA")
+    
+    parsed_data = json.loads(response_text[json_start:json_end])
+    return parsed_data.get("medications", [])
+
+async def read_image(file):
+    """Lit la photo par morceaux (413 au-delà de UPLOAD_MAX_BYTES) en calculant son empreinte"""
+    try:
+        with metrics.STAGE_DURATION.time("upload_read"):
+            return await read_upload(file, SERVICE_CONFIG["image"]["max_size"])
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+async def prepare_image_part(image_data, content_type, max_dimensions=None):
+    """Prétraite l'image et construit la partie image de la requête Gemini"""
+    # Redressement, réduction et réencodage hors de la boucle d'événements
+    loop = asyncio.get_running_loop()
+    with metrics.STAGE_DURATION.time("preprocess"):
+        image_data, content_type = await loop.run_in_executor(
+            None, preprocess_image, image_data, content_type, max_dimensions)
+    
+    # Octets bruts : le SDK les place tels quels dans le Blob, alors qu'une
+    # chaîne base64 serait encodée ici puis redécodée par le SDK
+    return {"mime_type": content_type, "data": image_data}
+
+def parse_batch_response(response_text, count):
+    """Découpe la réponse multi-images ; None pour une image absente de la réponse"""
+    json_start = response_text.find('{')
+    json_end = response_text.rfind('}') + 1
+    results = [None] * count
+    if json_start == -1 or json_end <= json_start:
+        return results
+    try:
+        parsed_data = json.loads(response_text[json_start:json_end])
+    except json.JSONDecodeError:
+        return results
+    for entry in parsed_data.get("images", []):
+        index = entry.get("image")
+        if isinstance(index, int) and 1 <= index <= count:
+            results[index - 1] = tuple(entry.get("medications", []))
+    return results
+
+async def call_model(image_part, model_name=None, prompt=ANALYSIS_PROMPT, mode="single"):
+    """Un appel Gemini pour une image ; retourne l'extraction brute"""
+    model = await get_model_async(model_name)
+    metrics.GEMINI_CALLS.inc(1, mode)
+    with metrics.STAGE_DURATION.time("gemini_call"):
+        response = await gemini.generate_content(model, [prompt, image_part])
+    
+    response_text = response.text
+    metrics.GEMINI_RESPONSE_BYTES.observe(len(response_text))
+    with metrics.STAGE_DURATION.time("json_parse"):
+        return tuple(parse_model_response(response_text))
+
+async def call_model_batch(image_parts):
+    """Un seul appel Gemini pour plusieurs images, découpé en un résultat par image"""
+    if len(image_parts) == 1:
+        return [await call_model(image_parts[0])]
+    
+    contents = [BATCH_PROMPT]
+    for number, image_part in enumerate(image_parts, start=1):
+        contents += [f"Image {number} :", image_part]
+    model = await get_model_async()
+    metrics.GEMINI_CALLS.inc(1, "batch")
+    with metrics.STAGE_DURATION.time("gemini_call"):
+        response = await gemini.generate_content(model, contents)
+    
+    response_text = response.text
+    metrics.GEMINI_RESPONSE_BYTES.observe(len(response_text))
+    with metrics.STAGE_DURATION.time("json_parse"):
+        return parse_batch_response(response_text, len(image_parts))
+
+# Regroupement optionnel des envois simultanés (désactivé si la fenêtre vaut 0)
+coalescer = None
+if SERVICE_CONFIG["gemini"]["coalesce_window"] > 0:
+    coalescer = RequestCoalescer(
+        call_model_batch,
+        window=SERVICE_CONFIG["gemini"]["coalesce_window"],
+        max_batch=SERVICE_CONFIG["gemini"]["coalesce_max_batch"]
+    )
+
+# Bilan de la cascade (images acceptées au premier passage, escalades, latence économisée)
+cascade_stats = CascadeStats()
+
+def barcodes_enabled():
+    return BARCODES["enabled"] and DECODER_AVAILABLE
+
+def analysis_pipeline():
+    """Modèle(s) produisant l'extraction, pour la clé du cache"""
+    pipeline = MODEL_NAME
+    if CASCADE["enabled"]:
+        pipeline = f"{CASCADE['fast_model']}@{CASCADE['fast_dimension']}<{CASCADE['min_confidence']}>{MODEL_NAME}"
+    if barcodes_enabled():
+        pipeline = f"gs1{'+count' if BARCODES['count_units'] else ''}+{pipeline}"
+    return pipeline
+
+async def count_units(upload, content_type, medications):
+    """Unités restantes des boîtes lues dans les codes, comptées par Gemini avec une consigne courte"""
+    image_part = await prepare_image_part(upload.data, content_type)
+    boxes = "\n".join(f"        {number}. {medication['nom']} ({medication['laboratoire']}), lot {medication['numero_lot']}"
+                      for number, medication in enumerate(medications, start=1))
+    model = await get_model_async()
+    metrics.GEMINI_CALLS.inc(1, "count")
+    with metrics.STAGE_DURATION.time("gemini_call"):
+        response = await gemini.generate_content(model, [COUNT_PROMPT.format(boxes=boxes), image_part])
+    return apply_unit_counts(medications, response.text)
+
+def needs_count(medications):
+    """Comptage par Gemini : demandé (BARCODE_COUNT_UNITS=1) ou contenu d'une boîte absent du catalogue"""
+    return BARCODES["count_units"] or any(medication["nombre_unites"] <= 0 for medication in medications)
+
+async def barcode_pass(upload, content_type):
+    """Lecture locale des codes GS1 ; None si l'image doit passer par l'analyse complète.
+
+    Sans comptage, les unités sont celles d'une boîte pleine du catalogue,
+    avec une confiance de CATALOG_UNITS_CONFIDENCE, et Gemini n'est pas appelé :
+    une boîte dont le code n'est pas visible n'est alors pas repérée. Avec
+    comptage, Gemini signale aussi les boîtes absentes des codes et l'image
+    passe dans ce cas par l'analyse complète.
+    """
+    loop = asyncio.get_running_loop()
+    with metrics.STAGE_DURATION.time("barcode_decode"):
+        medications, reason = await loop.run_in_executor(None, read_medications, upload.data, product_catalog)
+    counted = reason is None and needs_count(medications)
+    if counted:
+        try:
+            medications = await count_units(upload, content_type, medications)
+        except UncodedBoxes as e:
+            logger.info(f"Codes GS1 : {e}")
+            reason = "uncoded"
+        except Exception as e:
+            # Quota épuisé : l'analyse complète serait refusée de la même façon
+            if gemini.is_quota_error(e):
+                raise
+            logger.warning(f"Codes GS1 : comptage des unités impossible ({e})")
+            reason = "count"
+    metrics.BARCODE_IMAGES.inc(1, reason or ("counted" if counted else "local"))
+    if reason is not None:
+        logger.info(f"Codes GS1 : image transmise à l'analyse complète ({reason})")
+        return None
+    if counted:
+        logger.info(f"Codes GS1 : {len(medications)} médicament(s) lus dans les codes, unités comptées par Gemini")
+    else:
+        logger.info(f"Codes GS1 : {len(medications)} médicament(s) lus sans Gemini")
+    return tuple(medications)
+
+async def fast_pass(upload, content_type):
+    """Premier passage de la cascade ; None si l'image doit passer au modèle complet"""
+    start = time.perf_counter()
+    extracted = None
+    try:
+        image_part = await prepare_image_part(upload.data, content_type, (CASCADE["fast_dimension"],) * 2)
+        extracted = await call_model(image_part, CASCADE["fast_model"], FAST_PROMPT, "fast")
+        reason = escalation_reason(extracted, CASCADE["min_confidence"])
+    except (HTTPException, ValueError):
+        # Réponse sans JSON exploitable
+        reason = "parse"
+    except Exception as e:
+        # Quota épuisé : le modèle complet serait refusé de la même façon
+        if gemini.is_quota_error(e):
+            raise
+        logger.warning(f"Cascade : erreur du modèle rapide ({e})")
+        reason = "error"
+    cascade_stats.record_fast(time.perf_counter() - start, reason)
+    metrics.CASCADE_IMAGES.inc(1, reason or "accepted")
+    if reason is not None:
+        logger.info(f"Cascade : image transmise au modèle complet ({reason})")
+        return None
+    return extracted
+
+async def extract_medications(upload, content_type):
+    """Extraction brute (sans id ni horodatage), servie depuis le cache si possible.
+
+    Avec BARCODE_FAST_PATH=1, les codes GS1 DataMatrix de la photo sont lus
+    d'abord localement : si chaque code se lit et désigne une présentation du
+    catalogue, la réponse vient des codes et du catalogue ; Gemini ne compte
+    les unités restantes qu'avec BARCODE_COUNT_UNITS=1 ou pour une boîte au
+    contenu inconnu.
+    
+    Avec GEMINI_CASCADE=1, un modèle rapide analyse d'abord une version
+    réduite de l'image ; seules les images sans médicament extrait, dont
+    un médicament reste sous CASCADE_MIN_CONFIDENCE, dont la réponse est
+    illisible ou dont l'appel a échoué (hors quota) sont réanalysées par le modèle complet, dont le résultat remplace alors
+    celui du premier passage.
+    """
+    cache_key = AnalysisCache.key(upload.digest, analysis_pipeline(), PROMPT_VERSION)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Analyse servie depuis le cache")
+        return cached
+    
+    extracted = None
+    if barcodes_enabled():
+        extracted = await barcode_pass(upload, content_type)
+    if extracted is None and CASCADE["enabled"]:
+        extracted = await fast_pass(upload, content_type)
+    if extracted is None:
+        start = time.perf_counter()
+        image_part = await prepare_image_part(upload.data, content_type)
         
         logger.info("Début analyse Gemini avec prompt amélioré")
-        response = model.generate_content([prompt, image_part])
+        if coalescer is not None:
+            extracted = await coalescer.submit(image_part)
+        if extracted is None:
+            # Appel individuel, ou image oubliée par la réponse groupée
+            extracted = await call_model(image_part)
+        cascade_stats.record_full(time.perf_counter() - start)
+    analysis_cache.put(cache_key, extracted)
+    return extracted
+
+async def stream_medications(upload, content_type):
+    """Comme extract_medications, mais produit chaque médicament dès que Gemini l'a écrit"""
+    cache_key = AnalysisCache.key(upload.digest, analysis_pipeline(), PROMPT_VERSION)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Analyse servie depuis le cache")
+        for med_data in cached:
+            yield med_data
+        return
+    
+    if barcodes_enabled():
+        extracted = await barcode_pass(upload, content_type)
+        if extracted is not None:
+            analysis_cache.put(cache_key, extracted)
+            for med_data in extracted:
+                yield med_data
+            return
+    
+    image_part = await prepare_image_part(upload.data, content_type)
+    model = await get_model_async()
+    parser = MedicationStreamParser()
+    extracted = []
+    chunks = []
+    
+    logger.info("Début analyse Gemini en streaming")
+    metrics.GEMINI_CALLS.inc(1, "stream")
+    start = time.perf_counter()
+    async for text in gemini.stream_content(model, [ANALYSIS_PROMPT, image_part]):
+        chunks.append(text)
+        for med_data in parser.feed(text):
+            if not extracted:
+                metrics.STAGE_DURATION.observe(time.perf_counter() - start, "gemini_first_medication")
+            extracted.append(med_data)
+            yield med_data
+    metrics.STAGE_DURATION.observe(time.perf_counter() - start, "gemini_stream")
+    
+    response_text = "".join(chunks)
+    metrics.GEMINI_RESPONSE_BYTES.observe(len(response_text))
+    if not parser.found:
+        # Format inattendu : analyse du texte complet
+        for med_data in parse_model_response(response_text):
+            extracted.append(med_data)
+            yield med_data
+    elif not parser.finished:
+        # Réponse tronquée : les médicaments déjà lus sont gardés, sans mise en cache
+        return
+    analysis_cache.put(cache_key, tuple(extracted))
+
+async def store_medications(extracted, session_id, timestamp=None):
+    """Crée les MedicationInfo d'une analyse et les ajoute au stockage.
+
+    Nouveaux id et horodatage à chaque envoi, même servi depuis le cache.
+    """
+    start = time.perf_counter()
+    medications = []
+    timestamp = timestamp or datetime.now().isoformat()
+    
+    for med_data in extracted:
+        medication = MedicationInfo(
+            id=str(uuid.uuid4()),
+            nom=med_data.get("nom", "Non identifié"),
+            laboratoire=med_data.get("laboratoire", "Non identifié"),
+            date_peremption=med_data.get("date_peremption", "Non identifié"),
+            numero_lot=med_data.get("numero_lot", "Non identifié"),
+            nombre_unites=med_data.get("nombre_unites", 0),
+            confiance=med_data.get("confiance", 0.0),
+            timestamp=timestamp,
+            session_id=session_id
+        )
+        medications.append(medication)
+    
+    await medications_storage.run(medications_storage.add_many, session_id, medications)
+    metrics.STAGE_DURATION.observe(time.perf_counter() - start, "storage")
+    metrics.MEDICATIONS_EXTRACTED.inc(len(medications))
+    return medications
+
+def quota_exceeded():
+    """429 quand Gemini refuse encore faute de quota après les nouveaux essais"""
+    return HTTPException(
+        status_code=429,
+        detail="Quota Gemini atteint, réessayez plus tard",
+        headers={"Retry-After": str(gemini.retry_after())}
+    )
+
+# Envois identiques simultanés (même clé d'idempotence, ou même image dans la session) ;
+# avec SQLite, la réservation en base couvre aussi les autres workers gunicorn
+single_flight = SingleFlight(
+    SERVICE_CONFIG["single_flight"]["retention"],
+    claims=medications_storage,
+    encode=lambda medications: [medication.model_dump() for medication in medications],
+    decode=lambda records: [MedicationInfo(**record) for record in records]
+)
+
+async def analyze_and_store(upload, content_type, session_id):
+    extracted = await extract_medications(upload, content_type)
+    return await store_medications(extracted, session_id)
+
+@app.post("/analyze-medication", response_model=AnalysisResponse)
+async def analyze_medication(file: UploadFile = File(...), session_id: str = "default",
+                             idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """Analyser une image et stocker ses médicaments.
+
+    Un renvoi de la même image dans la session (ou avec le même en-tête
+    Idempotency-Key) pendant que la première analyse attend Gemini partage
+    son résultat : un seul appel au modèle, médicaments stockés une fois.
+    Avec Idempotency-Key, la réponse est aussi rejouée pendant
+    IDEMPOTENCY_TTL secondes après la fin de l'analyse.
+    """
+    metrics.REQUESTS.inc(1, "analyze-medication")
+    try:
+        if not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="Le fichier doit être une image")
         
-        response_text = response.text
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
+        if not GEMINI_AVAILABLE:
+            raise HTTPException(status_code=503, detail="Service Gemini non disponible")
         
-        if json_start != -1 and json_end != -1:
-            json_str = response_text[json_start:json_end]
-            parsed_data = json.loads(json_str)
-            
-            medications = []
-            timestamp = datetime.now().isoformat()
-            
-            for med_data in parsed_data.get("medications", []):
-                medication = MedicationInfo(
-                    id=str(uuid.uuid4()),
-                    nom=med_data.get("nom", "Non identifié"),
-                    laboratoire=med_data.get("laboratoire", "Non identifié"),
-                    date_peremption=med_data.get("date_peremption", "Non identifié"),
-                    numero_lot=med_data.get("numero_lot", "Non identifié"),
-                    nombre_unites=med_data.get("nombre_unites", 0),
-                    confiance=med_data.get("confiance", 0.0),
-                    timestamp=timestamp,
-                    session_id=session_id
-                )
-                medications.append(medication)
-                # Stocker en mémoire
-                medications_storage.append(medication)
-            
-            logger.info(f"Analyse réussie: {len(medications)} médicaments ajoutés au stockage")
-            return AnalysisResponse(
-                medications=medications,
-                success=True,
-                message=f"Analyse terminée. {len(medications)} médicament(s) ajouté(s) au stockage."
+        upload = await read_image(file)
+        if SERVICE_CONFIG["single_flight"]["enabled"]:
+            key = SingleFlight.key(session_id, idempotency_key, upload.digest)
+            medications, origin = await single_flight.run(
+                key, lambda: analyze_and_store(upload, file.content_type, session_id),
+                remember=idempotency_key is not None
             )
         else:
-            raise HTTPException(status_code=500, detail="Réponse invalide de l'IA")
+            medications, origin = await analyze_and_store(upload, file.content_type, session_id), "leader"
+        
+        if origin == "leader":
+            logger.info(f"Analyse réussie: {len(medications)} médicaments ajoutés au stockage")
+        else:
+            metrics.DEDUPLICATED_REQUESTS.inc(1, origin)
+            logger.info(f"Analyse dédoublonnée ({origin}): {len(medications)} médicaments déjà stockés")
+        return AnalysisResponse(
+            medications=medications,
+            success=True,
+            message=f"Analyse terminée. {len(medications)} médicament(s) ajouté(s) au stockage."
+        )
             
-    except HTTPException:
+    except HTTPException as e:
+        metrics.ERRORS.inc(1, f"http_{e.status_code}")
         raise
     except Exception as e:
+        if gemini.is_quota_error(e):
+            metrics.ERRORS.inc(1, "http_429")
+            raise quota_exceeded()
+        metrics.ERRORS.inc(1, type(e).__name__)
         logger.error(f"Erreur analyse: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'analyse: {str(e)}")
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/analyze-medication/stream")
+async def analyze_medication_stream(file: UploadFile = File(...), session_id: str = "default"):
+    """Analyse en streaming (Server-Sent Events).
+
+    Un événement "medication" par médicament, stocké dès que Gemini a fini
+    de l'écrire, puis "done" (ou "error").
+    """
+    metrics.REQUESTS.inc(1, "analyze-medication/stream")
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Le fichier doit être une image")
+    
+    if not GEMINI_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Service Gemini non disponible")
+    
+    upload = await read_image(file)
+    
+    async def stream_events():
+        timestamp = datetime.now().isoformat()
+        count = 0
+        try:
+            async for med_data in stream_medications(upload, file.content_type):
+                medication = (await store_medications([med_data], session_id, timestamp))[0]
+                count += 1
+                yield sse_event("medication", medication.model_dump())
+        except HTTPException as e:
+            metrics.ERRORS.inc(1, f"http_{e.status_code}")
+            yield sse_event("error", {"detail": e.detail, "stored": count})
+            return
+        except Exception as e:
+            if gemini.is_quota_error(e):
+                metrics.ERRORS.inc(1, "http_429")
+                error = quota_exceeded()
+                yield sse_event("error", {"detail": error.detail, "stored": count,
+                                          "retry_after": int(error.headers["Retry-After"])})
+                return
+            metrics.ERRORS.inc(1, type(e).__name__)
+            logger.error(f"Erreur analyse streaming: {str(e)}")
+            yield sse_event("error", {"detail": f"Erreur lors de l'analyse: {str(e)}", "stored": count})
+            return
+        
+        logger.info(f"Analyse streaming réussie: {count} médicaments ajoutés au stockage")
+        yield sse_event("done", {
+            "success": True,
+            "total": count,
+            "message": f"Analyse terminée. {count} médicament(s) ajouté(s) au stockage."
+        })
+    
+    return StreamingResponse(stream_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/analyze-medications/batch")
+async def analyze_medications_batch(files: List[UploadFile] = File(...), session_id: str = "default"):
+    """Analyser plusieurs images en parallèle, résultats diffusés en NDJSON.
+
+    Une ligne JSON par image dès que son analyse se termine (dans l'ordre
+    d'achèvement), puis une ligne finale de synthèse. Les médicaments sont
+    stockés au fur et à mesure. La concurrence est bornée par
+    GEMINI_MAX_CONCURRENCY.
+    """
+    metrics.REQUESTS.inc(1, "analyze-medications/batch")
+    if not GEMINI_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Service Gemini non disponible")
+    
+    async def analyze_one(index, file):
+        result = {"index": index, "filename": file.filename}
+        try:
+            if not (file.content_type or "").startswith("image/"):
+                raise HTTPException(status_code=400, detail="Le fichier doit être une image")
+            upload = await read_image(file)
+            extracted = await extract_medications(upload, file.content_type)
+            medications = await store_medications(extracted, session_id)
+            result.update(success=True, medications=[med.model_dump() for med in medications])
+        except HTTPException as e:
+            metrics.ERRORS.inc(1, f"http_{e.status_code}")
+            result.update(success=False, error=e.detail)
+        except Exception as e:
+            if gemini.is_quota_error(e):
+                metrics.ERRORS.inc(1, "http_429")
+                error = quota_exceeded()
+                result.update(success=False, error=error.detail, retry_after=int(error.headers["Retry-After"]))
+                return result
+            metrics.ERRORS.inc(1, type(e).__name__)
+            logger.error(f"Erreur analyse lot ({file.filename}): {str(e)}")
+            result.update(success=False, error=f"Erreur lors de l'analyse: {str(e)}")
+        return result
+    
+    async def stream_results():
+        tasks = [asyncio.ensure_future(analyze_one(index, file)) for index, file in enumerate(files)]
+        succeeded = 0
+        total_medications = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result["success"]:
+                    succeeded += 1
+                    total_medications += len(result["medications"])
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        logger.info(f"Analyse par lot: {succeeded}/{len(files)} images, {total_medications} médicaments ajoutés")
+        yield json.dumps({
+            "done": True,
+            "images": len(files),
+            "succeeded": succeeded,
+            "total_medications": total_medications
+        }, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+async def run_analysis_job(payload, session_id):
+    """Traitement d'un job : les erreurs transitoires de Gemini sont reprises par la file"""
+    upload, content_type = payload
+    extracted = await extract_medications(upload, content_type)
+    medications = await store_medications(extracted, session_id)
+    return AnalysisResponse(
+        medications=medications,
+        success=True,
+        message=f"Analyse terminée. {len(medications)} médicament(s) ajouté(s) au stockage."
+    ).model_dump()
+
+# File d'analyses asynchrones (JOB_WORKERS workers, JOB_QUEUE_SIZE jobs en attente au maximum)
+analysis_jobs = JobQueue(
+    run_analysis_job,
+    medications_storage,
+    **SERVICE_CONFIG["jobs"]
+)
+
+@app.post("/jobs/analyze-medication", status_code=202)
+async def submit_analysis_job(file: UploadFile = File(...), session_id: str = "default"):
+    """Enregistrer une image et retourner immédiatement un identifiant de job"""
+    metrics.REQUESTS.inc(1, "jobs/analyze-medication")
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Le fichier doit être une image")
+    
+    if not GEMINI_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Service Gemini non disponible")
+    
+    upload = await read_image(file)
+    try:
+        job = await analysis_jobs.submit((upload, file.content_type), session_id)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="File d'analyse pleine, réessayez plus tard", headers={"Retry-After": "5"})
+    
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+        "queue_depth": analysis_jobs.depth
+    }
+
+async def get_job_record(job_id):
+    job = await analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """État d'un job ; le résultat est inclus une fois l'analyse terminée"""
+    job = await get_job_record(job_id)
+    return job.to_dict() if isinstance(job, AnalysisJob) else job
+
+@app.get("/jobs/{job_id}/events")
+async def analysis_job_events(job_id: str):
+    """Suivi d'un job en Server-Sent Events jusqu'à son état final"""
+    await get_job_record(job_id)
+    
+    async def stream_events():
+        last_update = None
+        while True:
+            job = await analysis_jobs.get(job_id)
+            record = job.to_dict() if isinstance(job, AnalysisJob) else job
+            if record is None:
+                return
+            if record["updated_at"] != last_update:
+                last_update = record["updated_at"]
+                yield sse_event(record["status"], record)
+            if record["status"] in TERMINAL_STATUSES:
+                return
+            if isinstance(job, AnalysisJob):
+                if not await job.wait_for_change(timeout=15):
+                    yield ": keep-alive\n\n"
+            else:
+                # Job traité par un autre worker : suivi par l'état enregistré
+                await asyncio.sleep(1)
+    
+    return StreamingResponse(stream_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+MEDICATION_FIELDS = set(MedicationInfo.model_fields)
+
+async def session_etag(session_id):
+    """ETag faible : identifiant du stockage et version de la session"""
+    version = await medications_storage.run(medications_storage.version, session_id)
+    return f'W/"{medications_storage.instance_id}-{version}"'
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
 @app.get("/medications", response_model=StorageResponse)
-async def get_all_medications(session_id: str = "default"):
-    """Récupérer tous les médicaments stockés"""
-    session_meds = [med for med in medications_storage if med.session_id == session_id]
-    total_units = sum(med.nombre_unites for med in session_meds)
-    
-    return StorageResponse(
-        medications=session_meds,
-        total_count=len(session_meds),
+async def get_all_medications(request: Request, session_id: str = "default",
+                              limit: Optional[int] = Query(None, ge=1, le=10000), after: int = Query(0, ge=0),
+                              fields: Optional[str] = None):
+    """Récupérer les médicaments stockés (pagination par curseur, champs au choix)"""
+    # Session inchangée : 304 sans lire ni sérialiser les médicaments. La version est
+    # lue avant les données : au pire le corps est plus récent que son ETag.
+    etag = await session_etag(session_id)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    include = None
+    if fields:
+        include = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = include - MEDICATION_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Champs inconnus : {', '.join(sorted(unknown))}")
+    
+    def read_page():
+        medications, next_cursor = medications_storage.page(session_id, after, limit)
+        return medications, next_cursor, medications_storage.count(session_id), medications_storage.total_units(session_id)
+    
+    medications, next_cursor, total_count, total_units = await medications_storage.run(read_page)
+    body = {
+        "medications": [medication.model_dump(include=include) for medication in medications],
+        "total_count": total_count,
+        "total_units": total_units,
+        "next_cursor": next_cursor
+    }
+    return Response(content=json.dumps(body, ensure_ascii=False), media_type="application/json", headers=headers)
+
+@app.get("/medications/expiring", response_model=ExpiringResponse)
+async def get_expiring_medications(within_days: int = Query(30, ge=0, le=36500), include_expired: bool = True,
+                                   session_id: str = "default"):
+    """Médicaments périmés ou qui périment dans les within_days prochains jours"""
+    today = date.today()
+    since = None if include_expired else today
+    rows = await medications_storage.run(
+        medications_storage.expiring, session_id, today + timedelta(days=within_days), since)
+    expiring = [
+        ExpiringMedication(**medication.model_dump(), expiry=expiry, expiry_precision=precision,
+                           days_left=(expiry - today).days)
+        for medication, expiry, precision in rows
+    ]
+    return ExpiringResponse(
+        medications=expiring,
+        total_count=len(expiring),
+        total_units=sum(medication.nombre_unites for medication in expiring),
+        within_days=within_days
+    )
+
+# Tableaux NumPy par session, recalculés quand la version de la session change
+analytics_cache = AnalyticsCache(**SERVICE_CONFIG["analytics"])
+
+@app.get("/medications/analytics", response_model=AnalyticsResponse)
+async def get_medication_analytics(low_confidence: float = Query(0.5, ge=0, le=1), bins: int = Query(10, ge=1, le=100),
+                                   session_id: str = "default"):
+    """Statistiques de la session : laboratoires, confiance et péremptions par mois"""
+    if not NUMPY_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Statistiques indisponibles : NumPy n'est pas installé")
+    version = await medications_storage.run(medications_storage.version, session_id)
+    columns = None
+    if not analytics_cache.is_current(session_id, version):
+        columns = await medications_storage.run(medications_storage.numeric_columns, session_id)
+    result = analytics_cache.get(session_id, version, lambda: columns, (date.today(), low_confidence, bins))
+    return AnalyticsResponse(version=version, **result)
+
+@app.get("/medications/changes", response_model=ChangesResponse)
+async def get_medication_changes(since: int = Query(0, ge=0), instance_id: Optional[str] = None,
+                                 session_id: str = "default"):
+    """Modifications de la session depuis la version since (ajouts et vidages)"""
+    if instance_id is not None and instance_id != medications_storage.instance_id:
+        # Stockage redémarré ou recréé : les versions du client ne veulent plus rien dire
+        since = -1
+    entries = await medications_storage.run(medications_storage.changes, session_id, since)
+    return ChangesResponse(
+        version=entries[-1][0] if entries else since,
+        instance_id=medications_storage.instance_id,
+        reset=bool(entries) and entries[0][1] == "snapshot",
+        changes=[
+            MedicationChange(version=version, op=op, medications=medications)
+            for version, op, medications in entries
+        ]
+    )
+
+@app.get("/medications/stock", response_model=StockResponse)
+async def get_stock(session_id: str = "default"):
+    """Stock consolidé par produit et numéro de lot, avec totaux par laboratoire"""
+    (lines, laboratories), total_units = await medications_storage.run(
+        lambda: (medications_storage.stock(session_id), medications_storage.total_units(session_id)))
+    return StockResponse(
+        lines=lines,
+        laboratories=laboratories,
+        total_lines=len(lines),
         total_units=total_units
     )
 
 @app.delete("/medications")
 async def clear_medications(session_id: str = "default"):
     """Vider le stockage des médicaments"""
-    global medications_storage
-    before_count = len(medications_storage)
-    medications_storage = [med for med in medications_storage if med.session_id != session_id]
-    after_count = len(medications_storage)
-    cleared = before_count - after_count
+    cleared, remaining = await medications_storage.run(
+        lambda: (medications_storage.clear(session_id), len(medications_storage)))
     
-    return {"message": f"{cleared} médicament(s) supprimé(s)", "remaining": after_count}
+    return {"message": f"{cleared} médicament(s) supprimé(s)", "remaining": remaining}
 
-@app.get("/medications/export")
-async def export_medications_csv(session_id: str = "default"):
-    """Exporter les médicaments en CSV"""
-    from fastapi.responses import Response
+CSV_HEADER = ["Nom", "Laboratoire", "Date péremption", "Numéro de lot", "Unités", "Confiance (%)", "Horodatage"]
+CSV_CHUNK_SIZE = 64 * 1024
+
+def accepts_gzip(accept_encoding):
+    """Vrai si Accept-Encoding accepte gzip avec q > 0 (directement ou via *)"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+def iter_csv(medications, compress=False):
+    """Produit le CSV par blocs d'environ CSV_CHUNK_SIZE octets, compressé en gzip si demandé"""
+    buffer = io.StringIO()
+    # Texte entre guillemets (échappés), nombres sans guillemets
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    
+    def flush():
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(chunk) if compressor else chunk
     
-    session_meds = [med for med in medications_storage if med.session_id == session_id]
+    buffer.write(",".join(CSV_HEADER) + "\n")
+    for med in medications:
+        writer.writerow([med.nom, med.laboratoire, med.date_peremption, med.numero_lot,
+                         med.nombre_unites, round(med.confiance * 100), med.timestamp])
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            chunk = flush()
+            if chunk:
+                yield chunk
     
-    if not session_meds:
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+@app.get("/medications/export")
+async def export_medications_csv(request: Request, session_id: str = "default"):
+    """Exporter les médicaments en CSV (diffusé par blocs, gzip si le client l'accepte)"""
+    if not await medications_storage.run(medications_storage.count, session_id):
         raise HTTPException(status_code=404, detail="Aucun médicament à exporter")
     
-    # Créer le CSV
-    csv_content = "Nom,Laboratoire,Date péremption,Numéro de lot,Unités,Confiance (%),Horodatage\n"
-    for med in session_meds:
-        csv_content += f'"{med.nom}","{med.laboratoire}","{med.date_peremption}","{med.numero_lot}",{med.nombre_unites},{round(med.confiance * 100)},"{med.timestamp}"\n'
+    compress = accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {
+        "Content-Disposition": f"attachment; filename=medicaments_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        "Vary": "Accept-Encoding"
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
     
-    return Response(
-        content=csv_content,
+    return StreamingResponse(
+        iter_csv(medications_storage.iter_session(session_id), compress),
         media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=medicaments_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
+        headers=headers
     )
 
 if __name__ == "__main__":
@@ -2,8 +2,18 @@
 Services module pour PharmStock Backend
 """
 
+import os
+
 SERVICE_CONFIG = {
-    "gemini": {"model_name": "gemini-1.5-flash", "max_retries": 3, "timeout": 30, "temperature": 0.1},
-    "image": {"max_size": 10 * 1024 * 1024, "allowed_formats": ["image/jpeg", "image/jpg", "image/png", "image/webp"], "quality": 85, "max_dimensions": (3000, 3000)},
+    "gemini": {"model_name": "gemini-1.5-flash", "max_retries": int(os.getenv("GEMINI_MAX_RETRIES", "3")), "timeout": 30, "temperature": 0.1, "max_concurrency": int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")), "coalesce_window": float(os.getenv("GEMINI_COALESCE_WINDOW_MS", "0")) / 1000, "coalesce_max_batch": int(os.getenv("GEMINI_COALESCE_MAX_BATCH", "4")), "rpm": float(os.getenv("GEMINI_RPM", "0")), "burst": int(os.getenv("GEMINI_BURST", "5")), "latency_target": float(os.getenv("GEMINI_LATENCY_TARGET", "0")), "retry_delay": float(os.getenv("GEMINI_RETRY_DELAY", "1.0")), "max_wait": float(os.getenv("GEMINI_MAX_WAIT", "30")), "adaptive": os.getenv("GEMINI_ADAPTIVE", "1") == "1"},
+    "cascade": {"enabled": os.getenv("GEMINI_CASCADE", "0") == "1", "fast_model": os.getenv("GEMINI_FAST_MODEL", "gemini-1.5-flash-8b"), "fast_dimension": int(os.getenv("CASCADE_FAST_DIMENSION", "768")), "min_confidence": float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.7"))},
+    "image": {"max_size": int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024))), "max_request_size": int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(50 * 1024 * 1024))), "allowed_formats": ["image/jpeg", "image/jpg", "image/png", "image/webp"], "quality": int(os.getenv("IMAGE_QUALITY", "85")), "max_dimensions": (int(os.getenv("IMAGE_MAX_DIMENSION", "2048")),) * 2, "format": os.getenv("IMAGE_FORMAT", "JPEG").upper(), "preprocess": os.getenv("IMAGE_PREPROCESS", "1") == "1"},
+    "cache": {"max_entries": int(os.getenv("ANALYSIS_CACHE_SIZE", "256")), "ttl": int(os.getenv("ANALYSIS_CACHE_TTL", "3600"))},
+    "jobs": {"workers": int(os.getenv("JOB_WORKERS", "4")), "max_depth": int(os.getenv("JOB_QUEUE_SIZE", "100")), "max_retries": int(os.getenv("JOB_MAX_RETRIES", "0")), "retry_delay": float(os.getenv("JOB_RETRY_DELAY", "1.0")), "retention": int(os.getenv("JOB_RETENTION", "3600"))},
+    "analytics": {"max_sessions": int(os.getenv("ANALYTICS_CACHE_SESSIONS", "32"))},
+    "storage": {"backend": os.getenv("STORAGE_BACKEND", "memory"), "sqlite_path": os.getenv("SQLITE_PATH", "pharmstock.db"), "change_log_size": int(os.getenv("CHANGE_LOG_SIZE", "1000"))},
+    "single_flight": {"enabled": os.getenv("SINGLE_FLIGHT", "1") == "1", "retention": int(os.getenv("IDEMPOTENCY_TTL", "300"))},
+    "barcodes": {"enabled": os.getenv("BARCODE_FAST_PATH", "0") == "1", "products_path": os.getenv("GS1_PRODUCTS_PATH", ""), "count_units": os.getenv("BARCODE_COUNT_UNITS", "0") == "1"},
+    "startup": {"lazy": os.getenv("FAST_STARTUP", "1") == "1", "warmup": os.getenv("STARTUP_WARMUP", "0") == "1"},
     "validation": {"min_confidence": 0.3, "max_medications_per_image": 20, "required_fields": ["nom", "laboratoire", "date_peremption", "numero_lot"]},
 }
@@ -0,0 +1,185 @@
+"""
+Statistiques d'inventaire vectorisées (NumPy), mises en cache par version de session
+"""
+
+import importlib.util
+from collections import OrderedDict
+
+from .dates import normalize_expiry
+from .stock import normalize_name
+
+# NumPy est optionnel : sans lui, /medications/analytics répond 503. Il n'est
+# importé qu'au premier calcul, pour ne pas ralentir le démarrage.
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+
+def load_numpy():
+    """Module numpy, importé au premier appel"""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+class SessionArrays:
+    """Colonnes numériques d'une session sous forme de tableaux NumPy.
+
+    Les chaînes (laboratoires, dates) restent des codes : normalisation et
+    lecture des dates ne sont faites qu'une fois par valeur distincte, puis
+    appliquées à toutes les lignes par indexation.
+    """
+
+    __slots__ = ("units", "confidence", "laboratory", "laboratories", "expiry", "month")
+
+    def __init__(self, columns):
+        load_numpy()
+        strings = columns.strings
+        self.units = np.frombuffer(columns.nombre_unites, dtype=np.int32).astype(np.int64)
+        self.confidence = np.frombuffer(columns.confiance, dtype=np.float64)
+
+        # Laboratoires regroupés comme dans le stock consolidé (libellé de la première ligne)
+        lab_codes = np.frombuffer(columns.laboratoire, dtype=np.uint32)
+        groups = {}
+        self.laboratories = []
+        lookup = np.zeros(len(strings), dtype=np.int64)
+        for code in np.unique(lab_codes).tolist():
+            key = normalize_name(strings[code])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = len(self.laboratories)
+                self.laboratories.append(strings[code])
+            lookup[code] = group
+        self.laboratory = lookup[lab_codes]
+
+        # Péremption : ordinal de la date (0 si illisible) et mois (année * 12 + mois - 1, -1 si illisible)
+        date_codes = np.frombuffer(columns.date_peremption, dtype=np.uint32)
+        ordinals = np.zeros(len(strings), dtype=np.int64)
+        months = np.full(len(strings), -1, dtype=np.int64)
+        for code in np.unique(date_codes).tolist():
+            expiry, _ = normalize_expiry(strings[code])
+            if expiry is not None:
+                ordinals[code] = expiry.toordinal()
+                months[code] = expiry.year * 12 + expiry.month - 1
+        self.expiry = ordinals[date_codes]
+        self.month = months[date_codes]
+
+    def __len__(self):
+        return len(self.units)
+
+
+def compute(arrays, today, low_confidence=0.5, bins=10):
+    """Agrégats d'une session : par laboratoire, histogramme de confiance, péremptions par mois"""
+    load_numpy()
+    units = arrays.units
+    confidence = arrays.confidence
+    scans = len(arrays)
+    total_units = int(units.sum())
+    low = confidence < low_confidence
+
+    groups = len(arrays.laboratories)
+    lab_scans = np.bincount(arrays.laboratory, minlength=groups)
+    lab_units = np.bincount(arrays.laboratory, weights=units, minlength=groups)
+    lab_confidence = np.bincount(arrays.laboratory, weights=confidence, minlength=groups)
+    lab_low = np.bincount(arrays.laboratory[low], minlength=groups)
+    laboratories = sorted(
+        ({"laboratoire": label, "scans": int(lab_scans[group]), "total_units": int(lab_units[group]),
+          "mean_confidence": round(float(lab_confidence[group] / lab_scans[group]), 4),
+          "low_confidence_scans": int(lab_low[group])}
+         for group, label in enumerate(arrays.laboratories)),
+        key=lambda entry: -entry["total_units"]
+    )
+
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    # Dernier intervalle fermé à droite : une confiance de 1.0 compte dans le dernier
+    bucket = np.clip(np.searchsorted(edges, confidence, side="right") - 1, 0, bins - 1)
+    bucket_scans = np.bincount(bucket, minlength=bins)
+    bucket_units = np.bincount(bucket, weights=units, minlength=bins)
+    histogram = [
+        {"min": round(float(edges[index]), 4), "max": round(float(edges[index + 1]), 4),
+         "scans": int(bucket_scans[index]), "total_units": int(bucket_units[index])}
+        for index in range(bins)
+    ]
+
+    readable = arrays.month >= 0
+    expired = readable & (arrays.expiry < today.toordinal())
+    months = []
+    if readable.any():
+        first = int(arrays.month[readable].min())
+        offsets = arrays.month[readable] - first
+        month_scans = np.bincount(offsets)
+        month_units = np.bincount(offsets, weights=units[readable])
+        current = today.year * 12 + today.month - 1
+        months = [
+            {"month": f"{(first + offset) // 12}-{(first + offset) % 12 + 1:02d}",
+             "scans": int(month_scans[offset]), "total_units": int(month_units[offset]),
+             "expired": first + offset < current}
+            for offset in np.flatnonzero(month_scans).tolist()
+        ]
+
+    return {
+        "scans": scans,
+        "total_units": total_units,
+        "laboratories": laboratories,
+        "confidence_histogram": histogram,
+        "low_confidence": {
+            "threshold": low_confidence,
+            "scans": int(low.sum()),
+            "total_units": int(units[low].sum()),
+            "share": round(float(low.mean()), 4) if scans else 0.0,
+        },
+        "expiry_months": months,
+        "expired_scans": int(expired.sum()),
+        "expired_units": int(units[expired].sum()),
+        "unreadable_expiry": int(scans - readable.sum()),
+    }
+
+
+class AnalyticsCache:
+    """Tableaux et résultats par session, valables tant que la version de la session ne change pas.
+
+    Borné à max_sessions sessions (LRU). Une session modifiée est relue en
+    entier à la requête suivante ; les paramètres de calcul (seuil, nombre
+    d'intervalles, date du jour) ont chacun leur résultat, dans la limite de
+    max_results par session (LRU).
+    """
+
+    def __init__(self, max_sessions=32, max_results=16):
+        self.max_sessions = max_sessions
+        self.max_results = max_results
+        self._sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def is_current(self, session_id, version):
+        """Vrai si les colonnes de cette version de la session sont en cache"""
+        entry = self._sessions.get(session_id)
+        return entry is not None and entry[0] == version
+
+    def get(self, session_id, version, load, params):
+        """Résultat pour params ; load() fournit les colonnes si la version a changé"""
+        entry = self._sessions.get(session_id)
+        if entry is None or entry[0] != version:
+            entry = (version, SessionArrays(load()), OrderedDict())
+            self._sessions[session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        results = entry[2]
+        result = results.get(params)
+        if result is None:
+            self.misses += 1
+            today, low_confidence, bins = params
+            result = results[params] = compute(entry[1], today, low_confidence, bins)
+            while len(results) > self.max_results:
+                results.popitem(last=False)
+        else:
+            self.hits += 1
+            results.move_to_end(params)
+        return result
+
+    def stats(self):
+        return {"sessions": len(self._sessions), "max_sessions": self.max_sessions,
+                "results": sum(len(entry[2]) for entry in self._sessions.values()),
+                "max_results": self.max_results, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,260 @@
+"""
+Lecture locale des codes GS1 DataMatrix des boîtes (CIP, lot, péremption)
+"""
+
+import csv
+import io
+import json
+import logging
+import re
+from datetime import date
+
+logger = logging.getLogger("pharmstock")
+
+try:
+    import zxingcpp
+except ImportError:  # Décodeur optionnel : sans lui, toutes les images passent par Gemini
+    zxingcpp = None
+
+DECODER_AVAILABLE = zxingcpp is not None
+
+# Contenu d'une boîte pleine, sans comptage : la boîte peut être entamée
+CATALOG_UNITS_CONFIDENCE = 0.5
+
+GROUP_SEPARATOR = "\x1d"
+
+# Identifiants d'application (AI) GS1 : longueur fixe des données, ou None pour
+# une longueur variable terminée par le séparateur de groupe
+_AI_LENGTHS = {
+    "00": 18, "01": 14, "02": 14, "11": 6, "12": 6, "13": 6, "15": 6, "16": 6, "17": 6, "20": 2,
+    "10": None, "21": None, "22": None, "30": None, "37": None, "240": None, "241": None,
+    "710": None, "711": None, "712": None, "713": None, "714": None, "715": None,
+    **{str(ai): None for ai in range(91, 100)},
+}
+_HRI_ELEMENT = re.compile(r"\((\d{2,4})\)([^()]*)")
+
+
+class GS1Error(ValueError):
+    """Code lu mais inexploitable (AI inconnu, clé de contrôle ou date invalide)"""
+
+
+class UncodedBoxes(ValueError):
+    """Boîtes visibles sur la photo sans code lu : la lecture des codes est incomplète"""
+
+
+def _split_raw(text):
+    elements = {}
+    position = 0
+    while position < len(text):
+        if text[position] == GROUP_SEPARATOR:
+            position += 1
+            continue
+        ai = next((text[position:position + size] for size in (2, 3)
+                   if text[position:position + size] in _AI_LENGTHS), None)
+        if ai is None:
+            raise GS1Error(f"AI GS1 inconnu : {text[position:position + 4]!r}")
+        position += len(ai)
+        length = _AI_LENGTHS[ai]
+        if length is None:
+            end = text.find(GROUP_SEPARATOR, position)
+            end = len(text) if end == -1 else end
+        else:
+            end = position + length
+            if end > len(text):
+                raise GS1Error(f"AI {ai} tronqué")
+        elements[ai] = text[position:end]
+        position = end
+    return elements
+
+
+def parse_element_string(text):
+    """Découpe une chaîne GS1 en {AI: valeur}.
+
+    Accepte la forme lue dans le symbole (identifiant de symbologie ]d2
+    éventuel, séparateur de groupe après les champs variables) et la forme
+    lisible "(01)...(17)...(10)...".
+    """
+    text = text.strip()
+    if text.startswith("]"):
+        text = text[3:]
+    if text.startswith("("):
+        elements = {ai: value for ai, value in _HRI_ELEMENT.findall(text)}
+        unknown = [ai for ai in elements if ai not in _AI_LENGTHS]
+        if unknown:
+            raise GS1Error(f"AI GS1 inconnu : {unknown[0]}")
+        return elements
+    return _split_raw(text)
+
+
+def gtin_is_valid(gtin):
+    """Clé de contrôle GS1 (modulo 10, poids 3 et 1 depuis la droite)"""
+    if len(gtin) != 14 or not gtin.isdigit():
+        return False
+    total = sum(int(digit) * (3 if index % 2 == 0 else 1) for index, digit in enumerate(reversed(gtin[:-1])))
+    return (10 - total % 10) % 10 == int(gtin[-1])
+
+
+def gs1_expiry(value, today=None):
+    """AI 17 (AAMMJJ) au format lu sur les boîtes : "JJ/MM/AAAA", ou "MM/AAAA" si le jour vaut 00"""
+    if len(value) != 6 or not value.isdigit():
+        raise GS1Error(f"Date GS1 invalide : {value!r}")
+    year, month, day = int(value[:2]), int(value[2:4]), int(value[4:])
+    # Siècle choisi par la fenêtre glissante GS1 (au plus 49 ans en arrière, 50 en avant)
+    current = (today or date.today()).year
+    year += current - current % 100
+    if year - current > 50:
+        year -= 100
+    elif current - year > 49:
+        year += 100
+    if not 1 <= month <= 12:
+        raise GS1Error(f"Date GS1 invalide : {value!r}")
+    if day == 0:
+        return f"{month:02d}/{year}"
+    try:
+        date(year, month, day)
+    except ValueError:
+        raise GS1Error(f"Date GS1 invalide : {value!r}")
+    return f"{day:02d}/{month:02d}/{year}"
+
+
+def parse_medication_code(text):
+    """GTIN, lot et péremption d'un code de boîte ; GS1Error si l'un d'eux manque ou est invalide"""
+    elements = parse_element_string(text)
+    gtin = elements.get("01", "")
+    if not gtin_is_valid(gtin):
+        raise GS1Error(f"GTIN invalide : {gtin!r}")
+    lot = elements.get("10", "").strip()
+    if not lot:
+        raise GS1Error("Numéro de lot absent du code")
+    if "17" not in elements:
+        raise GS1Error("Date de péremption absente du code")
+    return {"gtin": gtin, "numero_lot": lot, "date_peremption": gs1_expiry(elements["17"])}
+
+
+def cip13(gtin):
+    """Code CIP13 (GTIN-13) d'un GTIN-14 français 034..."""
+    return gtin[1:] if gtin.startswith("0") else gtin
+
+
+class ProductCatalog:
+    """Table locale CIP13 -> nom, laboratoire, unités par boîte.
+
+    Fichier CSV (séparateur ; ou ,) avec les colonnes cip13, nom,
+    laboratoire et unites, par exemple extrait de la base publique des
+    médicaments. unites est le contenu d'une boîte pleine : il sert de
+    nombre d'unités sans comptage et borne le comptage par Gemini ; vide ou
+    0 s'il est inconnu, les unités sont toujours comptées par Gemini.
+    """
+
+    def __init__(self, products=None):
+        self._products = dict(products or {})
+
+    @classmethod
+    def load(cls, path):
+        if not path:
+            return cls()
+        with open(path, newline="", encoding="utf-8") as handle:
+            sample = handle.read(4096)
+            handle.seek(0)
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+            products = {}
+            for row in csv.DictReader(handle, dialect=dialect):
+                try:
+                    products[row["cip13"].strip()] = (row["nom"].strip(), row["laboratoire"].strip(),
+                                                      int(row.get("unites") or 0))
+                except (KeyError, ValueError, AttributeError):
+                    continue
+        logger.info(f"Catalogue GS1 : {len(products)} présentations chargées depuis {path}")
+        return cls(products)
+
+    def __len__(self):
+        return len(self._products)
+
+    def get(self, gtin):
+        return self._products.get(cip13(gtin))
+
+
+def decode_symbols(image_data):
+    """Textes des codes 2D de l'image et nombre de codes repérés mais illisibles"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_data)) as image:
+        image = image.convert("L")
+        results = zxingcpp.read_barcodes(
+            image, formats=zxingcpp.BarcodeFormat.DataMatrix, text_mode=zxingcpp.TextMode.Plain,
+            return_errors=True,
+        )
+    texts = [result.bytes.decode("latin-1") for result in results if not result.error]
+    return texts, sum(1 for result in results if result.error)
+
+
+def read_medications(image_data, catalog, decode=None):
+    """Médicaments lus uniquement dans les codes de la photo.
+
+    Retourne (médicaments, None) si tous les codes repérés se lisent et
+    désignent des présentations du catalogue, sinon (None, raison) :
+    "no_code", "unreadable", "invalid" ou "unknown_product". Une boîte sans
+    code ne peut pas être repérée localement. Le code ne dit rien des unités
+    restantes : nombre_unites est le contenu d'une boîte pleine (0 s'il est
+    inconnu), avec une confiance de CATALOG_UNITS_CONFIDENCE, sauf comptage
+    par apply_unit_counts.
+    """
+    try:
+        texts, unreadable = (decode or decode_symbols)(image_data)
+    except Exception as e:
+        logger.warning(f"Lecture des codes impossible : {e}")
+        return None, "unreadable"
+    if unreadable:
+        return None, "unreadable"
+    if not texts:
+        return None, "no_code"
+    medications = []
+    for text in texts:
+        try:
+            code = parse_medication_code(text)
+        except GS1Error:
+            return None, "invalid"
+        product = catalog.get(code["gtin"])
+        if product is None:
+            return None, "unknown_product"
+        nom, laboratoire, unites = product
+        medications.append({
+            "nom": nom,
+            "laboratoire": laboratoire,
+            "date_peremption": code["date_peremption"],
+            "numero_lot": code["numero_lot"],
+            "nombre_unites": unites,
+            "confiance": CATALOG_UNITS_CONFIDENCE,
+        })
+    return medications, None
+
+
+def apply_unit_counts(medications, response_text):
+    """Médicaments lus dans les codes, avec les unités comptées par Gemini.
+
+    response_text est la réponse JSON à la consigne de comptage :
+    {"boites": [{"nombre_unites": n, "confiance": c}, ...], "autres_boites": n},
+    une entrée par médicament dans le même ordre. UncodedBoxes si Gemini voit
+    des boîtes absentes des codes, ValueError si la réponse est illisible,
+    n'a pas une entrée par boîte ou dépasse le contenu d'une boîte pleine.
+    """
+    start, end = response_text.find("{"), response_text.rfind("}") + 1
+    if start == -1 or end <= start:
+        raise ValueError("Comptage sans JSON")
+    try:
+        answer = json.loads(response_text[start:end])
+        counts = [(int(box["nombre_unites"]), float(box.get("confiance", 0))) for box in answer["boites"]]
+        uncoded = int(answer["autres_boites"])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Comptage illisible : {e}")
+    if uncoded > 0:
+        raise UncodedBoxes(f"{uncoded} boîte(s) sans code lu sur la photo")
+    if len(counts) != len(medications):
+        raise ValueError(f"{len(counts)} comptage(s) pour {len(medications)} boîte(s)")
+    counted = []
+    for medication, (units, confidence) in zip(medications, counts):
+        full_box = medication["nombre_unites"]
+        if units < 0 or (full_box > 0 and units > full_box):
+            raise ValueError(f"Comptage impossible : {units} unités pour {medication['nom']}")
+        counted.append(dict(medication, nombre_unites=units, confiance=min(max(confidence, 0.0), 1.0)))
+    return counted
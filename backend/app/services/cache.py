@@ -0,0 +1,64 @@
+"""
+Cache adressé par contenu des extractions Gemini
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class AnalysisCache:
+    """Cache LRU avec durée de vie, borné en nombre d'entrées.
+
+    La clé est un hash SHA-256 de l'empreinte de l'image (SHA-256 calculé à
+    la lecture de l'upload), du nom du modèle et de la version du prompt :
+    une nouvelle version du prompt invalide tout.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(image_digest, model_name, prompt_version):
+        return hashlib.sha256(f"{image_digest}\0{model_name}\0{prompt_version}".encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,63 @@
+"""
+Cascade de modèles : premier passage rapide, escalade des images incertaines
+"""
+
+
+def escalation_reason(extracted, min_confidence):
+    """"empty" si aucun médicament n'est extrait, "confidence" si un médicament est sous le seuil, sinon None"""
+    if not extracted:
+        # Le modèle rapide manque plus souvent les boîtes que le modèle complet
+        return "empty"
+    for medication in extracted:
+        try:
+            confidence = float(medication.get("confiance", 0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        if confidence < min_confidence:
+            return "confidence"
+    return None
+
+
+class CascadeStats:
+    """Bilan de la cascade depuis le démarrage.
+
+    La latence économisée est estimée à la lecture : chaque image acceptée
+    au premier passage aurait coûté la latence moyenne du modèle complet ;
+    le premier passage des images escaladées est du temps perdu.
+    """
+
+    def __init__(self):
+        self.accepted = 0
+        self.escalated = {}
+        self.fast_seconds = 0.0
+        self.wasted_seconds = 0.0
+        self.full_calls = 0
+        self.full_seconds = 0.0
+
+    def record_fast(self, latency, reason):
+        if reason is None:
+            self.accepted += 1
+            self.fast_seconds += latency
+        else:
+            self.escalated[reason] = self.escalated.get(reason, 0) + 1
+            self.wasted_seconds += latency
+
+    def record_full(self, latency):
+        self.full_calls += 1
+        self.full_seconds += latency
+
+    def latency_saved(self):
+        if not self.full_calls:
+            return 0.0
+        full_average = self.full_seconds / self.full_calls
+        return self.accepted * full_average - self.fast_seconds - self.wasted_seconds
+
+    def stats(self):
+        escalated = sum(self.escalated.values())
+        total = self.accepted + escalated
+        return {
+            "accepted": self.accepted,
+            "escalated": dict(self.escalated),
+            "escalation_rate": round(escalated / total, 4) if total else 0.0,
+            "latency_saved_seconds": round(self.latency_saved(), 3),
+        }
@@ -0,0 +1,55 @@
+"""
+Journal des modifications d'une session pour la synchronisation par delta
+"""
+
+
+class ChangeLog:
+    """Journal borné des modifications d'une session.
+
+    Chaque modification reçoit le numéro de version suivant : ("insert",
+    médicaments) ou ("clear", ()), où médicaments est une séquence (par
+    exemple un range de positions dans la session). Un vidage rend tout
+    l'historique inutile et remplace le journal. Au-delà de max_size
+    médicaments journalisés, les entrées les plus anciennes sont compactées :
+    floor est alors la plus ancienne version à partir de laquelle un client
+    peut encore se resynchroniser.
+    """
+
+    __slots__ = ("max_size", "version", "floor", "_entries", "_size")
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.version = 0
+        self.floor = 0
+        self._entries = []
+        self._size = 0
+
+    def append(self, op, medications=()):
+        self.version += 1
+        if op == "clear":
+            self._entries = [(self.version, op, ())]
+            self._size = 0
+            self.floor = 0
+            return
+        self._entries.append((self.version, op, medications))
+        self._size += len(medications)
+        if self._size > self.max_size:
+            self._compact()
+
+    def _compact(self):
+        dropped = 0
+        while self._size > self.max_size and dropped < len(self._entries) - 1:
+            version, _, medications = self._entries[dropped]
+            self._size -= len(medications)
+            self.floor = version
+            dropped += 1
+        del self._entries[:dropped]
+
+    def since(self, version):
+        """Entrées postérieures à version, ou None si le client doit tout recharger"""
+        if version < self.floor or version > self.version:
+            return None
+        index = len(self._entries)
+        while index > 0 and self._entries[index - 1][0] > version:
+            index -= 1
+        return self._entries[index:]
@@ -0,0 +1,58 @@
+"""
+Regroupement des envois simultanés en un seul appel Gemini multi-images
+"""
+
+import asyncio
+import logging
+
+from . import metrics
+
+logger = logging.getLogger("pharmstock")
+
+
+class RequestCoalescer:
+    """Regroupe les requêtes arrivées dans une fenêtre de `window` secondes.
+
+    Le lot part dès qu'il atteint `max_batch` éléments ou que la fenêtre
+    expire. run_batch(items) retourne un résultat par élément, dans l'ordre.
+    Une erreur de l'appel groupé est transmise à chaque requête du lot.
+    """
+
+    def __init__(self, run_batch, window=0.05, max_batch=4):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        metrics.COALESCED_BATCH_SIZE.observe(len(batch))
+        items = [item for item, _ in batch]
+        try:
+            results = await self.run_batch(items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,131 @@
+"""
+Représentation en colonnes des médicaments stockés en mémoire
+"""
+
+import uuid
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+# Colonnes utilisées par les statistiques : laboratoire et date_peremption sont
+# des codes dans strings, nombre_unites et confiance des tableaux typés
+NumericColumns = namedtuple("NumericColumns", "strings laboratoire date_peremption nombre_unites confiance")
+
+
+class _StringTable:
+    """Encodage par dictionnaire : chaque chaîne distincte n'est gardée qu'une fois"""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class MedicationColumns:
+    """Médicaments d'une session rangés par colonne.
+
+    - id : 16 octets par UUID dans un bytearray (les autres identifiants à part)
+    - nom, laboratoire, date_peremption : codes dans une table de chaînes
+      propre à la session
+    - numero_lot : presque toujours distinct, gardé tel quel dans une liste
+      (la chaîne est de toute façon partagée avec le stock consolidé)
+    - nombre_unites, confiance : tableaux typés
+    - timestamp : microsecondes depuis 1970 si l'horodatage ISO se reconstruit
+      à l'identique, sinon -(code + 1) dans la table de chaînes
+
+    Quelques dizaines d'octets par ligne au lieu d'un modèle pydantic complet ;
+    row() reconstruit les champs à la demande.
+    """
+
+    __slots__ = ("_ids", "_other_ids", "_strings", "_nom", "_laboratoire", "_date_peremption",
+                 "_numero_lot", "_nombre_unites", "_confiance", "_timestamps")
+
+    def __init__(self):
+        self._ids = bytearray()
+        self._other_ids = {}
+        self._strings = _StringTable()
+        self._nom = array("I")
+        self._laboratoire = array("I")
+        self._date_peremption = array("I")
+        self._numero_lot = []
+        self._nombre_unites = array("i")
+        self._confiance = array("d")
+        self._timestamps = array("q")
+
+    def __len__(self):
+        return len(self._nombre_unites)
+
+    def append(self, medication):
+        """Ajoute une ligne ; une valeur hors des types des colonnes (OverflowError,
+        TypeError) est rejetée avant toute écriture, les colonnes restent alignées"""
+        index = len(self)
+        units = array("i", (medication.nombre_unites,))
+        confidence = array("d", (medication.confiance,))
+        timestamp = self._pack_timestamp(medication.timestamp)
+        try:
+            packed = uuid.UUID(medication.id)
+        except ValueError:
+            packed = None
+        if packed is not None and str(packed) == medication.id:
+            self._ids += packed.bytes
+        else:
+            self._ids += bytes(16)
+            self._other_ids[index] = medication.id
+
+        encode = self._strings.encode
+        self._nom.append(encode(medication.nom))
+        self._laboratoire.append(encode(medication.laboratoire))
+        self._date_peremption.append(encode(medication.date_peremption))
+        self._numero_lot.append(medication.numero_lot)
+        self._nombre_unites.extend(units)
+        self._confiance.extend(confidence)
+        self._timestamps.append(timestamp)
+
+    def _pack_timestamp(self, value):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None and parsed.tzinfo is None and parsed >= _EPOCH and parsed.isoformat() == value:
+            return (parsed - _EPOCH) // _MICROSECOND
+        return -(self._strings.encode(value) + 1)
+
+    def _unpack_timestamp(self, packed):
+        if packed < 0:
+            return self._strings.values[-packed - 1]
+        return (_EPOCH + packed * _MICROSECOND).isoformat()
+
+    def numeric_columns(self):
+        """Copie des colonnes des statistiques (les tableaux peuvent ensuite grandir)"""
+        return NumericColumns(list(self._strings.values), self._laboratoire[:], self._date_peremption[:],
+                              self._nombre_unites[:], self._confiance[:])
+
+    def row(self, index):
+        """Champs de la ligne index (sans session_id)"""
+        strings = self._strings.values
+        medication_id = self._other_ids.get(index)
+        if medication_id is None:
+            digits = self._ids[index * 16:index * 16 + 16].hex()
+            medication_id = f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+        return {
+            "id": medication_id,
+            "nom": strings[self._nom[index]],
+            "laboratoire": strings[self._laboratoire[index]],
+            "date_peremption": strings[self._date_peremption[index]],
+            "numero_lot": self._numero_lot[index],
+            "nombre_unites": self._nombre_unites[index],
+            "confiance": self._confiance[index],
+            "timestamp": self._unpack_timestamp(self._timestamps[index]),
+        }
@@ -0,0 +1,32 @@
+"""
+Normalisation des dates de péremption lues sur les boîtes
+"""
+
+import calendar
+import re
+from datetime import date
+
+_DATE_RE = re.compile(r"^\s*(?:(\d{1,2})[/.\-])?(\d{1,2})[/.\-](\d{2}|\d{4})\s*$")
+
+
+def normalize_expiry(value):
+    """Convertit 'DD/MM/YYYY' ou 'MM/YYYY' en (date, précision).
+
+    La précision vaut "day" ou "month" ; une date au mois est ramenée au
+    dernier jour du mois. Retourne (None, None) si la date est illisible.
+    """
+    match = _DATE_RE.match(value or "")
+    if not match:
+        return None, None
+    day, month, year = match.groups()
+    month, year = int(month), int(year)
+    if year < 100:
+        year += 2000
+    if not 1 <= month <= 12:
+        return None, None
+    if day is None:
+        return date(year, month, calendar.monthrange(year, month)[1]), "month"
+    try:
+        return date(year, month, int(day)), "day"
+    except ValueError:
+        return None, None
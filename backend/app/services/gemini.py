@@ -0,0 +1,212 @@
+"""
+Exécution des appels Gemini hors de la boucle d'événements
+"""
+
+import asyncio
+import functools
+import importlib.util
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import SERVICE_CONFIG, metrics
+from .ratelimit import AdaptiveConcurrency, TokenBucket
+
+logger = logging.getLogger("pharmstock")
+
+_executor = None
+_models = {}
+_bucket = None
+_concurrency = None
+
+
+def sdk_available():
+    """Vrai si google.generativeai est installé (sans l'importer)"""
+    try:
+        return importlib.util.find_spec("google.generativeai") is not None
+    except ImportError:
+        return False
+
+
+def load_sdk(api_key=None):
+    """Importe google.generativeai et configure la clé.
+
+    L'import du SDK (et de ses clients gRPC) est le plus long du démarrage :
+    avec FAST_STARTUP=1, il n'a lieu qu'au premier appel à Gemini.
+    """
+    start = time.perf_counter()
+    import google.generativeai as genai
+
+    if api_key:
+        genai.configure(api_key=api_key)
+    logger.info(f"SDK Gemini chargé en {time.perf_counter() - start:.2f}s")
+    return genai
+
+
+def get_executor():
+    """Pool dédié aux appels Gemini, dimensionné par GEMINI_MAX_CONCURRENCY"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=SERVICE_CONFIG["gemini"]["max_concurrency"],
+            thread_name_prefix="gemini",
+        )
+    return _executor
+
+
+def get_model(factory, model_name):
+    """Client partagé par toutes les requêtes (un par fabrique et par modèle)"""
+    key = (factory, model_name)
+    model = _models.get(key)
+    if model is None:
+        model = _models[key] = factory(model_name)
+    return model
+
+
+def get_bucket():
+    """Seau à jetons réglé sur GEMINI_RPM (None si le débit n'est pas limité)"""
+    global _bucket
+    config = SERVICE_CONFIG["gemini"]
+    if _bucket is None and config["rpm"] > 0:
+        _bucket = TokenBucket(config["rpm"] / 60, config["burst"])
+    return _bucket
+
+
+def get_concurrency():
+    """Limite AIMD des appels simultanés, plafonnée à GEMINI_MAX_CONCURRENCY.
+
+    Avec GEMINI_ADAPTIVE=0, la limite reste fixe à GEMINI_MAX_CONCURRENCY.
+    """
+    global _concurrency
+    if _concurrency is None:
+        config = SERVICE_CONFIG["gemini"]
+        _concurrency = AdaptiveConcurrency(
+            config["max_concurrency"],
+            latency_target=config["latency_target"],
+            decrease=0.5 if config["adaptive"] else 1.0,
+        )
+    return _concurrency
+
+
+async def _admit():
+    bucket = get_bucket()
+    if bucket is not None:
+        await bucket.acquire(SERVICE_CONFIG["gemini"]["max_wait"] or None)
+    return await get_concurrency().acquire()
+
+
+def retry_after():
+    """Délai conseillé au client quand le quota est épuisé (secondes, au moins 1)"""
+    bucket = get_bucket()
+    delay = bucket.delay() if bucket is not None else SERVICE_CONFIG["gemini"]["retry_delay"]
+    return max(1, int(delay + 0.999))
+
+
+async def generate_content(model, contents, **kwargs):
+    """Appelle model.generate_content dans le pool sans bloquer la boucle.
+
+    Chaque essai passe par le seau à jetons puis par la limite AIMD ; les
+    erreurs transitoires (429, 503, délais) sont réessayées jusqu'à
+    max_retries fois avec un backoff exponentiel et du jitter. Si le seau
+    imposerait d'attendre plus de GEMINI_MAX_WAIT, RateLimited est levée
+    aussitôt.
+    """
+    config = SERVICE_CONFIG["gemini"]
+    loop = asyncio.get_running_loop()
+    call = functools.partial(model.generate_content, contents, **kwargs)
+    concurrency = get_concurrency()
+    attempt = 0
+    while True:
+        generation = await _admit()
+        start = time.perf_counter()
+        overloaded = False
+        try:
+            return await loop.run_in_executor(get_executor(), call)
+        except Exception as e:
+            overloaded = is_quota_error(e)
+            if overloaded:
+                metrics.GEMINI_THROTTLED.inc()
+            if attempt >= config["max_retries"] or not is_transient_error(e):
+                raise
+            error = e
+        finally:
+            concurrency.release(generation, time.perf_counter() - start, overloaded)
+        attempt += 1
+        delay = config["retry_delay"] * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        metrics.GEMINI_RETRIES.inc(1, "quota" if overloaded else "transient")
+        logger.warning(f"Appel Gemini en erreur transitoire ({error}), essai {attempt + 1} dans {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+async def stream_content(model, contents, **kwargs):
+    """Génération en streaming : produit le texte de chaque morceau dès sa réception.
+
+    L'itération bloquante du flux occupe une place du pool pendant toute
+    la durée de la réponse.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for chunk in model.generate_content(contents, stream=True, **kwargs):
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, ("chunk", chunk.text))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+
+    concurrency = get_concurrency()
+    generation = await _admit()
+    start = time.perf_counter()
+    overloaded = False
+    loop.run_in_executor(get_executor(), produce)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                overloaded = is_quota_error(value)
+                if overloaded:
+                    metrics.GEMINI_THROTTLED.inc()
+                raise value
+            yield value
+    finally:
+        stopped.set()
+        # Pas de nouvel essai : des morceaux ont peut-être déjà été transmis
+        concurrency.release(generation, None, overloaded)
+
+
+def shutdown():
+    global _executor, _bucket, _concurrency
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _models.clear()
+    _bucket = None
+    _concurrency = None
+
+
+_TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+_TRANSIENT_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                    "DeadlineExceeded", "InternalServerError", "GatewayTimeout"}
+
+
+def is_quota_error(error):
+    """Quota Gemini épuisé (HTTP 429)"""
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or getattr(error, "code", None) == 429
+
+
+def is_transient_error(error):
+    """Erreur Gemini qui mérite un nouvel essai (quota, indisponibilité, délai)"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in _TRANSIENT_NAMES:
+        return True
+    return getattr(error, "code", None) in _TRANSIENT_CODES
@@ -0,0 +1,55 @@
+"""
+Prétraitement des photos avant envoi à Gemini
+"""
+
+import io
+
+from . import SERVICE_CONFIG
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Tailles cumulées avant/après prétraitement, exposées par /health
+preprocessing_stats = {"images": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def preprocess_image(image_data, content_type, max_dimensions=None):
+    """Redresse selon l'EXIF, réduit et réencode une photo.
+
+    Retourne (octets, type MIME). Si Pillow ne sait pas lire l'image, ou si
+    le réencodage n'apporte rien, les octets d'origine sont conservés.
+    max_dimensions remplace IMAGE_MAX_DIMENSION (premier passage de la cascade).
+    """
+    config = SERVICE_CONFIG["image"]
+    max_dimensions = max_dimensions or config["max_dimensions"]
+    if not config["preprocess"]:
+        return image_data, content_type
+
+    # Import différé : Pillow n'est chargé qu'à la première photo
+    from PIL import ExifTags, Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            rotated = image.getexif().get(ExifTags.Base.Orientation, 1) != 1
+            # Décodage JPEG directement à une échelle réduite (1/2, 1/4, 1/8)
+            image.draft("RGB", max_dimensions)
+            image = ImageOps.exif_transpose(image)
+            size = image.size
+            image.thumbnail(max_dimensions, Image.LANCZOS)
+            resized = image.size != size
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, format=config["format"], quality=config["quality"], optimize=True)
+    except Exception:
+        return image_data, content_type
+
+    processed = output.getvalue()
+    if not (resized or rotated) and len(processed) >= len(image_data):
+        processed = image_data
+    else:
+        content_type = _MIME_TYPES[config["format"]]
+
+    preprocessing_stats["images"] += 1
+    preprocessing_stats["bytes_in"] += len(image_data)
+    preprocessing_stats["bytes_out"] += len(processed)
+    return processed, content_type
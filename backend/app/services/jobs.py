@@ -0,0 +1,166 @@
+"""
+File d'attente des analyses asynchrones (mode job)
+"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+
+from . import metrics
+from .gemini import is_quota_error, is_transient_error
+from .ratelimit import RateLimited
+
+logger = logging.getLogger("pharmstock")
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class AnalysisJob:
+    """Une analyse en attente ou en cours ; les octets de l'image sont libérés à la fin"""
+
+    def __init__(self, payload, session_id):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.payload = payload
+        self.status = "pending"
+        self.attempts = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._changed = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    async def wait_for_change(self, timeout=None):
+        """Attend la prochaine mise à jour ; False si le délai expire avant"""
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class JobQueue:
+    """Pool de workers asyncio avec file bornée et reprises sur erreurs transitoires.
+
+    handler(payload, session_id) est une coroutine qui retourne un dict JSON.
+    Chaque appel Gemini est déjà réessayé par gemini.generate_content : les
+    max_retries reprises du job entier (aucune par défaut) s'y ajoutent, et
+    un quota épuisé n'est jamais repris ici.
+    Chaque changement d'état est aussi confié à store.save_job (via
+    store.run, hors de la boucle pour SQLite) pour que les autres workers
+    gunicorn puissent répondre aux requêtes de suivi.
+    """
+
+    def __init__(self, handler, store, workers=4, max_depth=100, max_retries=0, retry_delay=1.0, retention=3600):
+        self.handler = handler
+        self.store = store
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self._queue = asyncio.Queue(maxsize=max_depth)
+        self._jobs = {}
+        self._tasks = []
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, payload, session_id):
+        await self._purge()
+        job = AnalysisJob(payload, session_id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull()
+        self._jobs[job.id] = job
+        await self.store.run(self.store.save_job, job.to_dict())
+        return job
+
+    async def get(self, job_id):
+        """Job local, sinon état enregistré par un autre worker (dict) ou None"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return await self.store.run(self.store.load_job, job_id)
+
+    async def _update(self, job, **changes):
+        for name, value in changes.items():
+            setattr(job, name, value)
+        job.updated_at = time.time()
+        changed, job._changed = job._changed, asyncio.Event()
+        changed.set()
+        await self.store.run(self.store.save_job, job.to_dict())
+
+    async def _purge(self):
+        limit = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in TERMINAL_STATUSES and job.updated_at < limit]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired:
+            await self.store.run(self.store.purge_jobs, limit)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _retryable(error):
+        # Quota : reprendre le job ne ferait que relancer les appels refusés
+        return is_transient_error(error) and not isinstance(error, RateLimited) and not is_quota_error(error)
+
+    async def _run(self, job):
+        while True:
+            await self._update(job, status="running", attempts=job.attempts + 1)
+            try:
+                result = await self.handler(job.payload, job.session_id)
+            except Exception as e:
+                if job.attempts <= self.max_retries and self._retryable(e):
+                    # Backoff exponentiel avec jitter
+                    delay = self.retry_delay * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5)
+                    logger.warning(f"Job {job.id}: erreur transitoire ({e}), nouvel essai dans {delay:.1f}s")
+                    await self._update(job, status="retrying", error=str(e))
+                    await asyncio.sleep(delay)
+                    continue
+                detail = getattr(e, "detail", None) or str(e)
+                status_code = getattr(e, "status_code", None)
+                metrics.ERRORS.inc(1, f"http_{status_code}" if status_code else type(e).__name__)
+                logger.error(f"Job {job.id} en échec: {detail}")
+                await self._update(job, status="failed", error=detail, payload=None)
+                return
+            await self._update(job, status="done", result=result, error=None, payload=None)
+            return
@@ -0,0 +1,93 @@
+"""
+Lecture incrémentale du JSON renvoyé par Gemini
+"""
+
+import json
+import re
+
+_ARRAY_START = re.compile(r'"medications"\s*:\s*\[')
+
+
+class MedicationStreamParser:
+    """Extrait chaque objet du tableau "medications" dès qu'il est complet.
+
+    Le texte arrive par morceaux via feed(). Seul le contenu du tableau est
+    analysé, en tenant compte des chaînes et des échappements : les
+    accolades du texte libre autour du JSON ne gênent pas.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._in_array = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+
+    @property
+    def found(self):
+        """Vrai dès que le début du tableau "medications" a été lu"""
+        return self._in_array or self._finished
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def feed(self, text):
+        """Ajoute du texte et retourne la liste des objets complétés"""
+        self._buffer += text
+        completed = []
+        if self._finished:
+            return completed
+
+        if not self._in_array:
+            match = _ARRAY_START.search(self._buffer)
+            if match is None:
+                return completed
+            self._in_array = True
+            self._position = match.end()
+
+        buffer = self._buffer
+        position = self._position
+        while position < len(buffer):
+            char = buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = position
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # Fin du tableau "medications"
+                    self._finished = True
+                    position += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        completed.append(json.loads(buffer[self._object_start:position + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._object_start = None
+            position += 1
+
+        # Ne garder que l'objet en cours pour ne pas rescanner le texte déjà lu
+        if self._object_start is not None:
+            self._buffer = buffer[self._object_start:]
+            position -= self._object_start
+            self._object_start = 0
+        else:
+            self._buffer = buffer[position:]
+            position = 0
+        self._position = position
+        return completed
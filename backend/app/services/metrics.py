@@ -0,0 +1,134 @@
+"""
+Métriques au format texte Prometheus (compteurs et histogrammes en mémoire)
+
+Les valeurs sont propres à chaque processus : avec plusieurs workers
+gunicorn, chaque scrape de /metrics reflète le worker qui répond.
+"""
+
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, *labelvalues):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        state = self._values.get(labelvalues)
+        if state is None:
+            # [compteurs par bucket (+Inf inclus), somme, nombre]
+            state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """Valeur lue au moment du scrape via une fonction (compteur tenu ailleurs si metric_type="counter")"""
+
+    def __init__(self, name, documentation, function, metric_type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.metric_type = metric_type
+        _registry.append(self)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}",
+                f"{self.name} {_format_value(self.function())}"]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUESTS = Counter("pharmstock_requests_total", "Requêtes d'analyse reçues", ["endpoint"])
+ERRORS = Counter("pharmstock_errors_total", "Erreurs d'analyse par type", ["type"])
+STAGE_DURATION = Histogram("pharmstock_stage_duration_seconds", "Durée de chaque étape de l'analyse", ["stage"])
+MEDICATIONS_EXTRACTED = Counter("pharmstock_medications_extracted_total", "Médicaments extraits et stockés")
+GEMINI_RESPONSE_BYTES = Histogram("pharmstock_gemini_response_bytes", "Taille des réponses Gemini", buckets=SIZE_BUCKETS)
+GEMINI_CALLS = Counter("pharmstock_gemini_calls_total", "Appels au modèle Gemini", ["mode"])
+COALESCED_BATCH_SIZE = Histogram("pharmstock_coalesced_batch_size", "Images par appel Gemini groupé",
+                                 buckets=(1, 2, 3, 4, 6, 8, 12, 16))
+GEMINI_THROTTLED = Counter("pharmstock_gemini_throttled_total", "Réponses 429 (quota épuisé) de Gemini")
+CASCADE_IMAGES = Counter("pharmstock_cascade_images_total", "Images du premier passage de la cascade (acceptées ou escaladées)", ["outcome"])
+BARCODE_IMAGES = Counter("pharmstock_barcode_images_total", "Images passées par la lecture locale des codes GS1 (lues ou transmises à Gemini)", ["outcome"])
+DEDUPLICATED_REQUESTS = Counter("pharmstock_deduplicated_requests_total", "Analyses servies par un calcul identique en cours ou déjà rejouable (clé d'idempotence)", ["outcome"])
+GEMINI_RETRIES = Counter("pharmstock_gemini_retries_total", "Nouveaux essais d'appels Gemini", ["reason"])
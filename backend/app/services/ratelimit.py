@@ -0,0 +1,111 @@
+"""
+Limitation du débit et de la concurrence des appels Gemini
+"""
+
+import asyncio
+import time
+from collections import deque
+
+
+class RateLimited(Exception):
+    """Attente au-delà de max_wait : la requête est refusée comme un 429"""
+
+    code = 429
+
+
+class TokenBucket:
+    """Seau à jetons : rate jetons par seconde, au plus burst en réserve.
+
+    acquire() réserve un jeton tout de suite, quitte à passer en négatif,
+    puis attend le temps de le rembourser : les appelants passent dans
+    l'ordre d'arrivée sans se réveiller tous ensemble.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """Secondes avant qu'un nouveau jeton soit disponible"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self, max_wait=None):
+        """Attend un jeton ; lève RateLimited si l'attente dépasserait max_wait"""
+        self._refill()
+        if max_wait is not None and (1 - self.tokens) / self.rate > max_wait:
+            raise RateLimited(f"Débit Gemini limité : attente supérieure à {max_wait:g}s")
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return
+        try:
+            await asyncio.sleep(-self.tokens / self.rate)
+        except asyncio.CancelledError:
+            self.tokens += 1
+            raise
+
+
+class AdaptiveConcurrency:
+    """Limite de concurrence AIMD (additive increase, multiplicative decrease).
+
+    Chaque appel réussi et assez rapide ajoute 1/limite à la limite (soit +1
+    par fenêtre complète d'appels) ; un 429 ou une latence au-delà de
+    latency_target la multiplie par decrease. Une seule baisse par
+    génération d'appels : les appels partis avant la dernière baisse ne la
+    répètent pas.
+    """
+
+    def __init__(self, maximum, minimum=1, latency_target=0, decrease=0.5):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._generation = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        """Attend une place libre ; retourne la génération à rendre à release()"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Place attribuée pendant l'annulation : la rendre
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(future)
+            raise
+        return self._generation
+
+    def release(self, generation, latency=None, overloaded=False):
+        self.in_flight -= 1
+        slow = bool(self.latency_target) and latency is not None and latency > self.latency_target
+        if overloaded or slow:
+            if generation == self._generation:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._generation += 1
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
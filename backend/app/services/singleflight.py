@@ -0,0 +1,125 @@
+"""
+Dédoublonnage des analyses identiques en cours (single-flight)
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class SingleFlight:
+    """Un seul calcul par clé à la fois ; les doublons attendent et partagent son résultat.
+
+    Le calcul tourne dans sa propre tâche : la déconnexion du premier client
+    ne l'annule pas pour les autres. Une erreur est transmise à tous les
+    appels en attente et n'est pas conservée. Avec remember=True (clé
+    d'idempotence fournie par le client), le résultat est encore rejoué
+    pendant `retention` secondes après la fin du calcul.
+
+    Avec claims (le stockage partagé), chaque clé est aussi réservée dans la
+    base : les autres workers attendent le résultat publié au lieu de
+    relancer le calcul. encode et decode convertissent le résultat en JSON
+    et retour. Une réservation dont le worker s'est arrêté expire après
+    claim_timeout secondes.
+    """
+
+    def __init__(self, retention=300, max_entries=1024, claims=None, encode=None, decode=None,
+                 claim_timeout=300, poll_interval=0.1, grace=5):
+        self.retention = retention
+        self.max_entries = max_entries
+        self.claims = claims
+        self.encode = encode or (lambda result: result)
+        self.decode = decode or (lambda result: result)
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        # Sans clé d'idempotence, résultat publié juste le temps que les autres workers le lisent
+        self.grace = grace
+        self._in_flight = {}
+        self._completed = OrderedDict()
+        self.leaders = 0
+        self.shared = 0
+        self.replayed = 0
+
+    @staticmethod
+    def key(session_id, idempotency_key=None, image_digest=None):
+        """Clé d'idempotence du client si fournie, sinon empreinte de l'image, dans la session"""
+        if idempotency_key:
+            source = f"key\0{session_id}\0{idempotency_key}"
+        else:
+            source = f"image\0{session_id}\0{image_digest}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def _replay(self, key):
+        entry = self._completed.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._completed[key]
+            return None
+        return result
+
+    async def run(self, key, compute, remember=False):
+        """(résultat, origine) : origine vaut "leader", "shared" ou "replayed" """
+        result = self._replay(key)
+        if result is not None:
+            self.replayed += 1
+            return result, "replayed"
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+            return (await asyncio.shield(task))[0], "shared"
+
+        task = asyncio.ensure_future(self._lead(key, compute, remember))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done, remember))
+        return await asyncio.shield(task)
+
+    async def _lead(self, key, compute, remember):
+        """Calcul de ce worker, ou attente du résultat d'un autre worker"""
+        if self.claims is None:
+            self.leaders += 1
+            return await compute(), "leader"
+        claims = self.claims
+        waited = False
+        while True:
+            now = time.time()
+            claim = await claims.run(claims.claim_request, key, now + self.claim_timeout, now, waited)
+            if claim is None:
+                break
+            if claim["result"] is not None:
+                origin = "shared" if waited else "replayed"
+                setattr(self, origin, getattr(self, origin) + 1)
+                return self.decode(claim["result"]), origin
+            waited = True
+            await asyncio.sleep(self.poll_interval)
+
+        self.leaders += 1
+        try:
+            result = await compute()
+        except BaseException:
+            await claims.run(claims.release_request, key)
+            raise
+        retention = self.retention if remember and self.retention > 0 else self.grace
+        await claims.run(claims.complete_request, key, self.encode(result), remember, time.time() + retention)
+        return result, "leader"
+
+    def _finish(self, key, task, remember):
+        self._in_flight.pop(key, None)
+        if not remember or task.cancelled() or task.exception() is not None or self.retention <= 0:
+            return
+        self._completed[key] = (time.monotonic() + self.retention, task.result()[0])
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.max_entries:
+            self._completed.popitem(last=False)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._in_flight),
+            "remembered": len(self._completed),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "replayed": self.replayed,
+        }
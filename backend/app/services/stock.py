@@ -0,0 +1,96 @@
+"""
+Stock consolidé par produit et numéro de lot
+"""
+
+import functools
+import re
+import unicodedata
+
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+_NUMBER_UNIT = re.compile(r"(\d) (?=[a-z])")
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_name(value):
+    """Clé de regroupement : sans accents ni ponctuation, '1000 MG' == '1000mg'"""
+    text = unicodedata.normalize("NFKD", value or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = _SEPARATORS.sub(" ", text).strip()
+    return _NUMBER_UNIT.sub(r"\1", text)
+
+
+def normalize_lot(value):
+    """Clé du numéro de lot : majuscules, sans espaces ni séparateurs"""
+    key = _SEPARATORS.sub("", (value or "").casefold()).upper()
+    # Réutiliser la chaîne d'origine quand elle est déjà normalisée
+    return value if key == value else key
+
+
+def stock_key(nom, numero_lot):
+    return normalize_name(nom), normalize_lot(numero_lot)
+
+
+class _StockLine:
+    __slots__ = ("nom", "laboratoire", "numero_lot", "lab_key", "scans", "total_units")
+
+    def __init__(self, medication, lab_key):
+        self.nom = medication.nom
+        self.laboratoire = medication.laboratoire
+        self.numero_lot = medication.numero_lot
+        self.lab_key = lab_key
+        self.scans = 0
+        self.total_units = 0
+
+
+class _LaboratoryRollup:
+    __slots__ = ("laboratoire", "lines", "scans", "total_units")
+
+    def __init__(self, laboratoire):
+        self.laboratoire = laboratoire
+        self.lines = 0
+        self.scans = 0
+        self.total_units = 0
+
+
+class StockAggregate:
+    """Agrégat d'une session mis à jour à chaque insertion (index par hachage).
+
+    Une ligne par (nom normalisé, lot) : nombre de photos et unités cumulées.
+    Le libellé affiché est celui de la première photo. Les totaux par
+    laboratoire suivent le laboratoire de chaque ligne. Lire l'agrégat coûte
+    O(nombre de lignes), quel que soit le nombre de photos.
+    """
+
+    def __init__(self):
+        self._lines = {}
+        self._laboratories = {}
+
+    def add(self, medication):
+        key = stock_key(medication.nom, medication.numero_lot)
+        line = self._lines.get(key)
+        if line is None:
+            line = self._lines[key] = _StockLine(medication, normalize_name(medication.laboratoire))
+            rollup = self._laboratories.get(line.lab_key)
+            if rollup is None:
+                rollup = self._laboratories[line.lab_key] = _LaboratoryRollup(medication.laboratoire)
+            rollup.lines += 1
+        else:
+            rollup = self._laboratories[line.lab_key]
+        line.scans += 1
+        line.total_units += medication.nombre_unites
+        rollup.scans += 1
+        rollup.total_units += medication.nombre_unites
+
+    def lines(self):
+        return [
+            {"nom": line.nom, "laboratoire": line.laboratoire, "numero_lot": line.numero_lot,
+             "scans": line.scans, "total_units": line.total_units}
+            for _, line in sorted(self._lines.items())
+        ]
+
+    def laboratories(self):
+        return [
+            {"laboratoire": rollup.laboratoire, "lines": rollup.lines,
+             "scans": rollup.scans, "total_units": rollup.total_units}
+            for _, rollup in sorted(self._laboratories.items())
+        ]
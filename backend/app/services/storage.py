@@ -0,0 +1,649 @@
+"""
+Stockage des médicaments indexé par session
+"""
+
+import asyncio
+import bisect
+import functools
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from array import array
+from datetime import date
+
+from . import SERVICE_CONFIG
+from .changes import ChangeLog
+from .columns import MedicationColumns, NumericColumns
+from .dates import normalize_expiry
+from .stock import StockAggregate, normalize_name, stock_key
+
+
+class _Session:
+    __slots__ = ("medications", "total_units", "expiry_keys", "expiry_rows", "stock")
+
+    def __init__(self):
+        self.medications = MedicationColumns()
+        self.total_units = 0
+        # Index des péremptions : clé = ordinal de la date * 2 (+1 si la date n'est
+        # connue qu'au mois), triée ; chaque clé pointe vers les positions dans
+        # medications (un simple entier tant qu'une seule ligne porte cette date).
+        # Il y a peu de dates distinctes : l'insertion reste en O(1).
+        self.expiry_keys = array("l")
+        self.expiry_rows = {}
+        self.stock = StockAggregate()
+
+
+class MedicationStore:
+    """Stockage en mémoire : une entrée par session avec compteurs à jour.
+
+    Lister, vider ou exporter une session coûte O(taille de la session),
+    indépendamment du nombre total d'enregistrements. Les lignes sont gardées
+    en colonnes ; les modèles ne sont construits que pour les réponses.
+    """
+
+    def __init__(self, model, change_log_size=1000):
+        self._model = model
+        self._sessions = {}
+        self._count = 0
+        # Les journaux (et donc les versions) survivent au vidage d'une session ;
+        # instance_id distingue les versions d'un redémarrage à l'autre
+        self._logs = {}
+        self.change_log_size = change_log_size
+        self.instance_id = uuid.uuid4().hex[:8]
+
+    async def run(self, function, *args):
+        """Appel direct depuis la boucle : rien ne bloque, et la structure n'est pas protégée entre threads"""
+        return function(*args)
+
+    def _log(self, session_id):
+        log = self._logs.get(session_id)
+        if log is None:
+            log = self._logs[session_id] = ChangeLog(self.change_log_size)
+        return log
+
+    def __len__(self):
+        return self._count
+
+    def _build(self, session_id, session, index):
+        row = session.medications.row(index)
+        row["session_id"] = session_id
+        return self._model.model_validate(row)
+
+    def add_many(self, session_id, medications):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+        first = len(session.medications)
+        try:
+            for medication in medications:
+                # Ligne ajoutée d'abord : si elle est rejetée, index et totaux restent intacts
+                row = len(session.medications)
+                session.medications.append(medication)
+                expiry, precision = normalize_expiry(medication.date_peremption)
+                if expiry is not None:
+                    key = expiry.toordinal() * 2 + (precision == "month")
+                    rows = session.expiry_rows.get(key)
+                    if rows is None:
+                        session.expiry_rows[key] = row
+                        bisect.insort(session.expiry_keys, key)
+                    elif isinstance(rows, int):
+                        session.expiry_rows[key] = array("l", (rows, row))
+                    else:
+                        rows.append(row)
+                session.total_units += medication.nombre_unites
+                session.stock.add(medication)
+        finally:
+            # Les lignes déjà ajoutées avant une erreur restent comptées et journalisées
+            added = len(session.medications) - first
+            self._count += added
+            if added:
+                # Le journal ne garde que les positions : les lignes restent dans les colonnes
+                self._log(session_id).append("insert", range(first, first + added))
+
+    def list(self, session_id):
+        return list(self.iter_session(session_id))
+
+    def page(self, session_id, after=0, limit=None):
+        """Médicaments suivant le curseur after ; retourne (page, curseur suivant ou None)"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return [], None
+        size = len(session.medications)
+        end = size if limit is None else min(after + limit, size)
+        medications = [self._build(session_id, session, index) for index in range(after, end)]
+        return medications, end if end < size else None
+
+    def iter_session(self, session_id):
+        """Parcourt la session sans la copier (les ajouts en cours sont ignorés)"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        for index in range(len(session.medications)):
+            yield self._build(session_id, session, index)
+
+    def expiring(self, session_id, until, since=None):
+        """Médicaments dont la péremption est comprise entre since et until, triés par date.
+
+        Retourne des tuples (médicament, date, précision) ; les dates illisibles
+        ne sont pas indexées.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return []
+        keys = session.expiry_keys
+        start = bisect.bisect_left(keys, since.toordinal() * 2) if since else 0
+        end = bisect.bisect_right(keys, until.toordinal() * 2 + 1)
+        results = []
+        for key in keys[start:end]:
+            expiry = date.fromordinal(key >> 1)
+            precision = "month" if key & 1 else "day"
+            rows = session.expiry_rows[key]
+            results.extend((self._build(session_id, session, row), expiry, precision)
+                           for row in ((rows,) if isinstance(rows, int) else rows))
+        return results
+
+    def stock(self, session_id):
+        """Stock consolidé : (lignes par produit et lot, totaux par laboratoire)"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return [], []
+        return session.stock.lines(), session.stock.laboratories()
+
+    def numeric_columns(self, session_id):
+        """Colonnes de la session pour les statistiques vectorisées"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return MedicationColumns().numeric_columns()
+        return session.medications.numeric_columns()
+
+    def version(self, session_id):
+        """Numéro incrémenté à chaque modification de la session"""
+        log = self._logs.get(session_id)
+        return log.version if log else 0
+
+    def changes(self, session_id, since):
+        """Entrées (version, op, médicaments) postérieures à since.
+
+        Si since est sorti du journal (compacté, ou version inconnue), une
+        seule entrée "snapshot" contient toute la session.
+        """
+        log = self._logs.get(session_id)
+        entries = log.since(since) if log else ([] if since == 0 else None)
+        if entries is None:
+            version = log.version if log else 0
+            return [(version, "snapshot", self.list(session_id))]
+        session = self._sessions.get(session_id)
+        return [
+            (version, op, [self._build(session_id, session, row) for row in rows])
+            for version, op, rows in entries
+        ]
+
+    def count(self, session_id):
+        session = self._sessions.get(session_id)
+        return len(session.medications) if session else 0
+
+    def total_units(self, session_id):
+        session = self._sessions.get(session_id)
+        return session.total_units if session else 0
+
+    def clear(self, session_id):
+        """Supprime la session et retourne le nombre de médicaments retirés"""
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return 0
+        self._log(session_id).append("clear")
+        cleared = len(session.medications)
+        self._count -= cleared
+        return cleared
+
+    # Les jobs d'analyse restent dans le processus : rien à partager
+    def save_job(self, record):
+        pass
+
+    def load_job(self, job_id):
+        return None
+
+    def purge_jobs(self, before):
+        pass
+
+    # Un seul processus : le single-flight en mémoire suffit, toute demande est accordée
+    def claim_request(self, key, expires_at, now, waiting=False):
+        return None
+
+    def complete_request(self, key, result, remember, expires_at):
+        pass
+
+    def release_request(self, key):
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS medications (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    session_id TEXT NOT NULL,
+    nom TEXT NOT NULL,
+    laboratoire TEXT NOT NULL,
+    date_peremption TEXT NOT NULL,
+    numero_lot TEXT NOT NULL,
+    nombre_unites INTEGER NOT NULL,
+    confiance REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    expiry TEXT,
+    expiry_precision TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_medications_session ON medications (session_id, seq);
+CREATE INDEX IF NOT EXISTS idx_medications_expiry ON medications (session_id, expiry);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    result TEXT,
+    remember INTEGER NOT NULL DEFAULT 0,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0,
+    total_units INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    log_floor INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS changes (
+    session_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    medications TEXT NOT NULL,
+    PRIMARY KEY (session_id, version)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stock (
+    session_id TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    lot_key TEXT NOT NULL,
+    lab_key TEXT NOT NULL,
+    nom TEXT NOT NULL,
+    laboratoire TEXT NOT NULL,
+    numero_lot TEXT NOT NULL,
+    scans INTEGER NOT NULL,
+    total_units INTEGER NOT NULL,
+    PRIMARY KEY (session_id, name_key, lot_key)
+);
+"""
+
+_STOCK_UPSERT = (
+    "INSERT INTO stock (session_id, name_key, lot_key, lab_key, nom, laboratoire, numero_lot, scans, total_units) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?) "
+    "ON CONFLICT (session_id, name_key, lot_key) DO UPDATE SET scans = scans + 1, "
+    "total_units = total_units + excluded.total_units"
+)
+
+_COLUMNS = ("id", "session_id", "nom", "laboratoire", "date_peremption", "numero_lot",
+            "nombre_unites", "confiance", "timestamp")
+
+
+class SQLiteMedicationStore:
+    """Stockage durable sur SQLite en mode WAL.
+
+    Plusieurs workers gunicorn peuvent partager le même fichier : chaque
+    écriture est une transaction BEGIN IMMEDIATE et les lecteurs ne sont
+    jamais bloqués par le journal WAL. Une connexion est ouverte par thread.
+    """
+
+    def __init__(self, path, model, change_log_size=1000):
+        self.path = path
+        self._model = model
+        self.change_log_size = change_log_size
+        self._local = threading.local()
+        self.instance_id = self._write(self._migrate)
+
+    def _migrate(self, conn):
+        """Crée le schéma et migre une base existante.
+
+        Tout se fait dans la transaction BEGIN IMMEDIATE de _write : des
+        workers qui démarrent ensemble attendent le verrou, puis relisent
+        sqlite_master et le schéma de sessions, et ne refont pas une
+        migration déjà faite. Renvoie l'identifiant de la base.
+        """
+        has_stock = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock'").fetchone()
+        # executescript validerait la transaction en cours : une instruction à la fois
+        for statement in _SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        if not has_stock:
+            self._rebuild_stock(conn)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+        for column in ("version", "log_floor"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        if "log_floor" not in columns:
+            # Sessions antérieures au journal : les clients repartent d'un instantané
+            conn.execute("UPDATE sessions SET version = version + 1, log_floor = version + 1 WHERE count > 0")
+        # Identifiant de la base : les versions repartent de zéro si le fichier est recréé
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('instance_id', ?)", (uuid.uuid4().hex[:8],))
+        return conn.execute("SELECT value FROM meta WHERE key = 'instance_id'").fetchone()[0]
+
+    def _rebuild_stock(self, conn):
+        """Calcule le stock consolidé d'une base créée avant la table stock"""
+        cursor = conn.execute(
+            "SELECT session_id, nom, laboratoire, numero_lot, nombre_unites FROM medications ORDER BY seq"
+        )
+        conn.executemany(_STOCK_UPSERT, [
+            (session_id, *stock_key(nom, numero_lot),
+             normalize_name(laboratoire), nom, laboratoire, numero_lot, units)
+            for session_id, nom, laboratoire, numero_lot, units in cursor.fetchall()
+        ])
+
+    async def run(self, function, *args):
+        """Appel dans le pool de threads : verrou d'écriture (jusqu'à busy_timeout) et disque hors de la boucle"""
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(function, *args))
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, statements):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def __len__(self):
+        row = self._connect().execute("SELECT COALESCE(SUM(count), 0) FROM sessions").fetchone()
+        return row[0]
+
+    def add_many(self, session_id, medications):
+        """Insère toutes les lignes d'une analyse en une seule transaction"""
+        if not medications:
+            return
+        rows = []
+        stock_rows = []
+        units = 0
+        for medication in medications:
+            expiry, precision = normalize_expiry(medication.date_peremption)
+            rows.append((
+                medication.id, session_id, medication.nom, medication.laboratoire,
+                medication.date_peremption, medication.numero_lot, medication.nombre_unites,
+                medication.confiance, medication.timestamp,
+                expiry.isoformat() if expiry else None, precision,
+            ))
+            stock_rows.append((
+                session_id, *stock_key(medication.nom, medication.numero_lot),
+                normalize_name(medication.laboratoire), medication.nom, medication.laboratoire, medication.numero_lot, medication.nombre_unites,
+            ))
+            units += medication.nombre_unites
+
+        def statements(conn):
+            conn.executemany(
+                f"INSERT INTO medications ({', '.join(_COLUMNS)}, expiry, expiry_precision) "
+                f"VALUES ({', '.join('?' * (len(_COLUMNS) + 2))})",
+                rows,
+            )
+            conn.execute(
+                "INSERT INTO sessions (session_id, count, total_units, version) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (session_id) DO UPDATE SET count = count + excluded.count, "
+                "total_units = total_units + excluded.total_units, version = version + 1",
+                (session_id, len(rows), units),
+            )
+            conn.executemany(_STOCK_UPSERT, stock_rows)
+            payload = json.dumps([medication.model_dump() for medication in medications], ensure_ascii=False)
+            self._log_change(conn, session_id, "insert", len(rows), payload)
+
+        self._write(statements)
+
+    def _log_change(self, conn, session_id, op, size, payload):
+        """Journalise la modification sous la version courante puis compacte le journal"""
+        version = conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()[0]
+        if op == "clear":
+            conn.execute("DELETE FROM changes WHERE session_id = ?", (session_id,))
+            conn.execute("UPDATE sessions SET log_floor = 0 WHERE session_id = ?", (session_id,))
+        conn.execute(
+            "INSERT INTO changes (session_id, version, op, size, medications) VALUES (?, ?, ?, ?, ?)",
+            (session_id, version, op, size, payload),
+        )
+        entries = conn.execute(
+            "SELECT version, size FROM changes WHERE session_id = ? ORDER BY version DESC", (session_id,)
+        ).fetchall()
+        total = 0
+        for index, (entry_version, entry_size) in enumerate(entries):
+            total += entry_size
+            if total > self.change_log_size and index > 0:
+                # Les entrées jusqu'à entry_version sont compactées
+                conn.execute("DELETE FROM changes WHERE session_id = ? AND version <= ?",
+                             (session_id, entry_version))
+                conn.execute("UPDATE sessions SET log_floor = ? WHERE session_id = ?", (entry_version, session_id))
+                break
+
+    def list(self, session_id):
+        cursor = self._connect().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM medications WHERE session_id = ? ORDER BY seq",
+            (session_id,),
+        )
+        return [self._model(**dict(zip(_COLUMNS, row))) for row in cursor]
+
+    def page(self, session_id, after=0, limit=None):
+        """Médicaments suivant le curseur after (seq) ; retourne (page, curseur suivant ou None)"""
+        query = (f"SELECT seq, {', '.join(_COLUMNS)} FROM medications "
+                 "WHERE session_id = ? AND seq > ? ORDER BY seq")
+        params = [session_id, after]
+        if limit is not None:
+            # Une ligne de plus pour savoir s'il reste une page
+            query += " LIMIT ?"
+            params.append(limit + 1)
+        rows = self._connect().execute(query, params).fetchall()
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        medications = [self._model(**dict(zip(_COLUMNS, row[1:]))) for row in rows]
+        return medications, rows[-1][0] if has_more else None
+
+    def iter_session(self, session_id, page_size=1000):
+        """Parcourt la session par pages (pagination sur seq, sans curseur ouvert)"""
+        last_seq = 0
+        while True:
+            rows = self._connect().execute(
+                f"SELECT seq, {', '.join(_COLUMNS)} FROM medications "
+                "WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (session_id, last_seq, page_size),
+            ).fetchall()
+            for row in rows:
+                yield self._model(**dict(zip(_COLUMNS, row[1:])))
+            if len(rows) < page_size:
+                return
+            last_seq = rows[-1][0]
+
+    def expiring(self, session_id, until, since=None):
+        """Médicaments dont la péremption est comprise entre since et until (index session, expiry)"""
+        query = (f"SELECT {', '.join(_COLUMNS)}, expiry, expiry_precision FROM medications "
+                 "WHERE session_id = ? AND expiry <= ?")
+        params = [session_id, until.isoformat()]
+        if since is not None:
+            query += " AND expiry >= ?"
+            params.append(since.isoformat())
+        cursor = self._connect().execute(query + " ORDER BY expiry, seq", params)
+        return [
+            (self._model(**dict(zip(_COLUMNS, row))), date.fromisoformat(row[-2]), row[-1])
+            for row in cursor
+        ]
+
+    def stock(self, session_id):
+        """Stock consolidé lu dans la table stock (une ligne par produit et lot)"""
+        conn = self._connect()
+        lines = [
+            {"nom": nom, "laboratoire": laboratoire, "numero_lot": numero_lot, "scans": scans,
+             "total_units": total_units}
+            for nom, laboratoire, numero_lot, scans, total_units in conn.execute(
+                "SELECT nom, laboratoire, numero_lot, scans, total_units FROM stock "
+                "WHERE session_id = ? ORDER BY name_key, lot_key", (session_id,)
+            )
+        ]
+        # Avec MIN(rowid), SQLite renvoie le libellé de la première ligne du laboratoire
+        laboratories = [
+            {"laboratoire": laboratoire, "lines": count, "scans": scans, "total_units": total_units}
+            for laboratoire, _, count, scans, total_units in conn.execute(
+                "SELECT laboratoire, MIN(rowid), COUNT(*), SUM(scans), SUM(total_units) FROM stock "
+                "WHERE session_id = ? GROUP BY lab_key ORDER BY lab_key", (session_id,)
+            )
+        ]
+        return lines, laboratories
+
+    def numeric_columns(self, session_id):
+        """Colonnes de la session pour les statistiques, chaînes encodées comme en mémoire"""
+        codes = {}
+        laboratoire, date_peremption = array("I"), array("I")
+        nombre_unites, confiance = array("i"), array("d")
+        cursor = self._connect().execute(
+            "SELECT laboratoire, date_peremption, nombre_unites, confiance FROM medications "
+            "WHERE session_id = ? ORDER BY seq", (session_id,)
+        )
+        for lab, expiry, units, confidence in cursor:
+            laboratoire.append(codes.setdefault(lab, len(codes)))
+            date_peremption.append(codes.setdefault(expiry, len(codes)))
+            nombre_unites.append(units)
+            confiance.append(confidence)
+        return NumericColumns(list(codes), laboratoire, date_peremption, nombre_unites, confiance)
+
+    def version(self, session_id):
+        """Numéro incrémenté à chaque modification de la session (conservé après un vidage)"""
+        row = self._connect().execute(
+            "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def changes(self, session_id, since):
+        """Entrées (version, op, médicaments) postérieures à since, ou une entrée "snapshot" hors du journal"""
+        conn = self._connect()
+        # Version, journal et instantané lus dans la même transaction
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT version, log_floor FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            version, floor = row or (0, 0)
+            if since < floor or since > version:
+                return [(version, "snapshot", self.list(session_id))]
+            rows = conn.execute(
+                "SELECT version, op, medications FROM changes WHERE session_id = ? AND version > ? ORDER BY version",
+                (session_id, since),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return [
+            (entry_version, op, [self._model(**medication) for medication in json.loads(medications)])
+            for entry_version, op, medications in rows
+        ]
+
+    def _session_row(self, session_id):
+        row = self._connect().execute(
+            "SELECT count, total_units FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row or (0, 0)
+
+    def count(self, session_id):
+        return self._session_row(session_id)[0]
+
+    def total_units(self, session_id):
+        return self._session_row(session_id)[1]
+
+    def clear(self, session_id):
+        """Supprime la session et retourne le nombre de médicaments retirés"""
+        def statements(conn):
+            cleared = conn.execute("DELETE FROM medications WHERE session_id = ?", (session_id,)).rowcount
+            updated = conn.execute(
+                "UPDATE sessions SET count = 0, total_units = 0, version = version + 1 WHERE session_id = ?",
+                (session_id,),
+            ).rowcount
+            conn.execute("DELETE FROM stock WHERE session_id = ?", (session_id,))
+            if updated:
+                self._log_change(conn, session_id, "clear", 0, "[]")
+            return cleared
+
+        return self._write(statements)
+
+    def save_job(self, record):
+        """Enregistre l'état d'un job pour les requêtes de suivi des autres workers.
+
+        Les écritures passent par des threads : un état plus ancien que celui
+        déjà enregistré est ignoré.
+        """
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO jobs (job_id, record, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (job_id) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at "
+            "WHERE excluded.updated_at >= jobs.updated_at",
+            (record["job_id"], json.dumps(record, ensure_ascii=False), record["updated_at"]),
+        ))
+
+    def load_job(self, job_id):
+        row = self._connect().execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def purge_jobs(self, before):
+        self._write(lambda conn: conn.execute("DELETE FROM jobs WHERE updated_at < ?", (before,)))
+
+    def claim_request(self, key, expires_at, now, waiting=False):
+        """Réserve une analyse pour ce worker jusqu'à expires_at.
+
+        Retourne None si la réservation est obtenue, sinon la ligne de
+        l'autre worker : {"result": résultat publié, ou None tant qu'il
+        calcule, "remember": bool}. Les réservations expirées (worker arrêté
+        en plein calcul) sont d'abord supprimées, de même qu'un résultat
+        sans clé d'idempotence si l'appelant n'attendait pas déjà ce calcul.
+        """
+        def statements(conn):
+            conn.execute("DELETE FROM idempotency WHERE expires_at < ?", (now,))
+            if not waiting:
+                conn.execute(
+                    "DELETE FROM idempotency WHERE key = ? AND result IS NOT NULL AND remember = 0", (key,)
+                )
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO idempotency (key, expires_at) VALUES (?, ?)", (key, expires_at)
+            ).rowcount
+            if inserted:
+                return None
+            result, remember = conn.execute(
+                "SELECT result, remember FROM idempotency WHERE key = ?", (key,)
+            ).fetchone()
+            return {"result": json.loads(result) if result is not None else None, "remember": bool(remember)}
+
+        return self._write(statements)
+
+    def complete_request(self, key, result, remember, expires_at):
+        """Publie le résultat (JSON) pour les autres workers jusqu'à expires_at"""
+        self._write(lambda conn: conn.execute(
+            "UPDATE idempotency SET result = ?, remember = ?, expires_at = ? WHERE key = ?",
+            (json.dumps(result, ensure_ascii=False), int(remember), expires_at, key),
+        ))
+
+    def release_request(self, key):
+        """Libère la réservation après un échec : un autre envoi refera l'analyse"""
+        self._write(lambda conn: conn.execute("DELETE FROM idempotency WHERE key = ?", (key,)))
+
+
+def create_store(model):
+    """Instancie le stockage choisi par STORAGE_BACKEND ("memory" ou "sqlite")"""
+    config = SERVICE_CONFIG["storage"]
+    if config["backend"] == "sqlite":
+        directory = os.path.dirname(config["sqlite_path"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteMedicationStore(config["sqlite_path"], model, config["change_log_size"])
+    return MedicationStore(model, config["change_log_size"])
@@ -0,0 +1,125 @@
+"""
+Lecture bornée des photos envoyées
+"""
+
+import hashlib
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Upload au-delà de la taille maximale : refusé comme un 413"""
+
+    code = 413
+
+
+class Upload:
+    """Octets d'une photo et leur empreinte SHA-256 (hex), calculée pendant la lecture"""
+
+    __slots__ = ("data", "digest")
+
+    def __init__(self, data, digest):
+        self.data = data
+        self.digest = digest
+
+
+async def read_upload(file, max_size, chunk_size=CHUNK_SIZE):
+    """Lit un UploadFile par morceaux.
+
+    Chaque morceau est haché au passage et copié dans un tampon alloué une
+    fois à la taille annoncée ; la lecture s'arrête dès que max_size est
+    dépassé, sans charger le reste du fichier.
+    """
+    size = getattr(file, "size", None)
+    if size is not None and size > max_size:
+        raise UploadTooLarge(f"Image trop volumineuse ({size} octets, maximum {max_size})")
+    digest = hashlib.sha256()
+    buffer = bytearray(size or 0)
+    position = 0
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        end = position + len(chunk)
+        if end > max_size:
+            raise UploadTooLarge(f"Image trop volumineuse (plus de {max_size} octets)")
+        digest.update(chunk)
+        # Au-delà de la taille annoncée, l'affectation agrandit le tampon
+        buffer[position:end] = chunk
+        position = end
+    # Le SDK exige des bytes : une seule copie, le tampon est libéré au retour
+    return Upload(bytes(memoryview(buffer)[:position]), digest.hexdigest())
+
+
+def image_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadLimitMiddleware:
+    """Refuse en 413 les corps de requête trop gros, pendant leur réception.
+
+    Content-Length est vérifié avant de lire quoi que ce soit ; sans lui, le
+    corps est compté au fil des messages et la lecture s'interrompt au-delà
+    de la limite (le reste n'est jamais mis en mémoire ni sur disque).
+    limits associe un chemin à sa propre limite (par exemple l'envoi par lot).
+    """
+
+    def __init__(self, app, max_body, limits=None):
+        self.app = app
+        self.max_body = max_body
+        self.limits = limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+        limit = self.limits.get(scope["path"], self.max_body)
+        headers = dict(scope["headers"])
+        try:
+            length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            length = 0
+        if length > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge(f"Requête trop volumineuse (plus de {limit} octets)")
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                # La réponse d'erreur de l'application est remplacée par le 413
+                if message["type"] == "http.response.start" and not started:
+                    started = True
+                    await self._reject(send, limit)
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            if not started:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit):
+        body = json.dumps({"detail": f"Requête trop volumineuse (maximum {limit} octets)"}, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
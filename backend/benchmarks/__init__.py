@@ -0,0 +1,13 @@
+"""
+Benchmarks PharmStock Backend (hors ligne, sans quota Gemini)
+
+Lancer depuis le dossier backend, par exemple :
+    python -m benchmarks.bench_event_loop
+
+Nécessite httpx en plus de requirements.txt.
+"""
+
+import logging
+
+for _name in ("httpx", "pharmstock"):
+    logging.getLogger(_name).setLevel(logging.WARNING)
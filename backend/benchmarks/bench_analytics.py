@@ -0,0 +1,95 @@
+"""
+Statistiques d'une session : boucle Python sur les médicaments contre tableaux NumPy
+
+    python -m benchmarks.bench_analytics --rows 100000 1000000
+
+Pour chaque taille, une seule session est remplie puis on mesure :
+- boucle Python : ce que le navigateur refait aujourd'hui à partir de la
+  liste complète (/medications), ici sur les modèles du stockage ;
+- NumPy après modification : relecture des colonnes, construction des
+  tableaux et agrégats (premier appel après un ajout) ;
+- NumPy en cache : même version de session, résultat déjà calculé ;
+- NumPy, autre seuil : tableaux en cache, agrégats recalculés.
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import date
+
+from app.main_storage import MedicationInfo
+from app.services.analytics import AnalyticsCache
+from app.services.dates import normalize_expiry
+from app.services.stock import normalize_name
+from app.services.storage import MedicationStore, SQLiteMedicationStore
+from benchmarks.bench_memory_store import analyses
+
+
+def python_analytics(medications, today, low_confidence=0.5, bins=10):
+    """Mêmes agrégats en Python pur, médicament par médicament"""
+    laboratories = {}
+    histogram = [0] * bins
+    months = {}
+    low = expired = 0
+    for medication in medications:
+        entry = laboratories.setdefault(normalize_name(medication.laboratoire), [medication.laboratoire, 0, 0, 0.0])
+        entry[1] += 1
+        entry[2] += medication.nombre_unites
+        entry[3] += medication.confiance
+        histogram[min(int(medication.confiance * bins), bins - 1)] += 1
+        low += medication.confiance < low_confidence
+        expiry, _ = normalize_expiry(medication.date_peremption)
+        if expiry is not None:
+            key = f"{expiry.year}-{expiry.month:02d}"
+            months[key] = months.get(key, 0) + medication.nombre_unites
+            if expiry < today:
+                expired += medication.nombre_unites
+    return laboratories, histogram, months, low, expired
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def run(rows, store_kind, seed):
+    store = (SQLiteMedicationStore(tempfile.mktemp(suffix=".db"), MedicationInfo) if store_kind == "sqlite"
+             else MedicationStore(MedicationInfo))
+    for _, medications in analyses(rows, 500, 1, seed):
+        store.add_many("bench", medications)
+    today = date.today()
+    cache = AnalyticsCache()
+
+    def numpy_analytics(low_confidence=0.5):
+        return cache.get("bench", store.version("bench"), lambda: store.numeric_columns("bench"),
+                         (today, low_confidence, 10))
+
+    python_time, (laboratories, _, months, _, expired) = timed(
+        lambda: python_analytics(store.iter_session("bench"), today))
+    cold_time, result = timed(numpy_analytics)
+    warm_time, _ = timed(numpy_analytics)
+    params_time, _ = timed(lambda: numpy_analytics(0.8))
+
+    # Les deux calculs doivent donner les mêmes agrégats
+    assert result["expired_units"] == expired
+    assert {entry["total_units"] for entry in result["laboratories"]} == {entry[2] for entry in laboratories.values()}
+    assert {entry["month"]: entry["total_units"] for entry in result["expiry_months"]} == months
+
+    print(f"{rows:>9} lignes ({store_kind}) | boucle Python {python_time * 1000:>9.1f} ms | "
+          f"NumPy après modification {cold_time * 1000:>8.1f} ms | en cache {warm_time * 1000:>6.3f} ms | "
+          f"autre seuil {params_time * 1000:>6.1f} ms", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--store", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.store, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Lecture locale des codes GS1 DataMatrix avant Gemini (BARCODE_FAST_PATH)
+
+    python -m benchmarks.bench_barcodes --images 200 --coded 0.7 --unknown 0.1 --latency 1.5
+    python -m benchmarks.bench_barcodes --count-units --count-latency 0.5
+
+Photos synthétiques (JPEG 1600x1200, bruit de capteur, léger flou) : une
+part --coded porte 1 à 3 codes de boîtes du catalogue, une part --unknown
+un code absent du catalogue, les autres aucun code. Le catalogue est écrit dans un CSV
+temporaire et relu comme GS1_PRODUCTS_PATH. Le faux Gemini répond après
+--latency secondes, ou --count-latency pour le seul comptage des unités des
+boîtes lues dans les codes (--count-units, BARCODE_COUNT_UNITS=1). Le rapport
+donne la part d'images lues dans les codes sans aucun appel Gemini, celle
+lue dans les codes puis comptée par Gemini, les appels Gemini et la latence
+par image selon le chemin suivi ; "erronées"
+compte les lectures locales dont lots ou péremptions diffèrent des codes
+imprimés, "manquées" les photos aux codes du catalogue passées par l'analyse complète.
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import httpx
+
+from app import main_storage
+from app.services.barcodes import DECODER_AVAILABLE, ProductCatalog, gs1_expiry
+from app.services.uploads import image_digest
+
+LABORATORIES = ("Sanofi", "Biogaran", "Mylan", "Sandoz", "Arrow", "Teva")
+
+
+def with_check_digit(body):
+    total = sum(int(digit) * (3 if index % 2 == 0 else 1) for index, digit in enumerate(reversed(body)))
+    return body + str((10 - total % 10) % 10)
+
+
+def write_catalog(path, gtins):
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle, delimiter=";")
+        writer.writerow(["cip13", "nom", "laboratoire", "unites"])
+        for index, gtin in enumerate(gtins):
+            writer.writerow([gtin[1:], f"MEDICAMENT {index} 500mg", LABORATORIES[index % len(LABORATORIES)],
+                             (8, 16, 20, 30)[index % 4]])
+
+
+def render_photo(codes, rng):
+    """Photo de 1600x1200 : une boîte claire par code, DataMatrix imprimé dessus"""
+    import numpy as np
+    import zxingcpp
+    from PIL import Image, ImageDraw, ImageFilter
+
+    # Plan de travail éclairé de biais, puis bruit de capteur sur toute l'image
+    photo = Image.fromarray(np.tile(np.linspace(150, 210, 1600, dtype=np.uint8), (1200, 1)))
+    draw = ImageDraw.Draw(photo)
+    for slot, code in enumerate(codes):
+        left, top = 60 + 520 * slot + int(rng.integers(0, 80)), int(rng.integers(60, 560))
+        draw.rectangle((left, top, left + 420, top + 560), fill=236)
+        symbol = zxingcpp.create_barcode(code, zxingcpp.BarcodeFormat.DataMatrix, gs1=True, forceSquare=True)
+        symbol = Image.fromarray(np.array(zxingcpp.write_barcode_to_image(symbol, scale=8)))
+        photo.paste(symbol, (left + 60, top + 60))
+    pixels = np.asarray(photo, dtype=np.int16) + rng.integers(-6, 7, (1200, 1600), dtype=np.int16)
+    photo = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(0.8))
+    buffer = io.BytesIO()
+    photo.convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def build_images(args):
+    """Images et, pour chacune, les (lot, péremption) attendus de la lecture locale"""
+    rng = random.Random(args.seed)
+    import numpy as np
+    noise = np.random.default_rng(args.seed)
+    known = [with_check_digit(f"034009{3000000 + index:07d}") for index in range(50)]
+    unknown = [with_check_digit(f"034009{9000000 + index:07d}") for index in range(50)]
+    images = []
+    for index in range(args.images):
+        draw = rng.random()
+        if draw < args.coded:
+            gtins = rng.sample(known, rng.randint(1, 3))
+        elif draw < args.coded + args.unknown:
+            gtins = [rng.choice(unknown)]
+        else:
+            gtins = []
+        codes, expected = [], []
+        for gtin in gtins:
+            expiry = date.today() + timedelta(days=rng.randint(30, 1500))
+            raw = f"{expiry:%y%m%d}"
+            lot = f"L{rng.randint(10000, 99999)}"
+            codes.append(f"(01){gtin}(17){raw}(10){lot}(21){index:08d}")
+            expected.append((lot, gs1_expiry(raw)))
+        images.append((render_photo(codes, noise), gtins and gtins[0] in known, sorted(expected)))
+    return known, images
+
+
+async def run_scenario(enabled, images, args):
+    main_storage.BARCODES["enabled"] = enabled
+    main_storage.BARCODES["count_units"] = args.count_units
+    main_storage.analysis_cache.clear()
+    calls = []
+    local_digests, counted_digests = set(), set()
+    generate = main_storage.gemini.generate_content
+    barcode_pass = main_storage.barcode_pass
+    count_units = main_storage.count_units
+
+    async def counting_generate(model, contents, **kwargs):
+        calls.append(model)
+        return await generate(model, contents, **kwargs)
+
+    async def recording_barcode_pass(upload, content_type):
+        extracted = await barcode_pass(upload, content_type)
+        if extracted is not None:
+            local_digests.add(upload.digest)
+        return extracted
+
+    async def recording_count_units(upload, content_type, medications):
+        counted_digests.add(upload.digest)
+        return await count_units(upload, content_type, medications)
+
+    main_storage.gemini.generate_content = counting_generate
+    main_storage.barcode_pass = recording_barcode_pass
+    main_storage.count_units = recording_count_units
+    latencies = {"local": [], "count": [], "gemini": []}
+    wrong = missed = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=main_storage.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def upload(image, local_expected, expected):
+            nonlocal wrong, missed
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/analyze-medication", params={"session_id": "bench"},
+                                             files={"file": ("photo.jpg", image, "image/jpeg")})
+                elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            digest = image_digest(image)
+            if digest not in local_digests:
+                path = "gemini"
+            else:
+                path = "count" if digest in counted_digests else "local"
+            latencies[path].append(elapsed)
+            if path != "gemini":
+                read = sorted((med["numero_lot"], med["date_peremption"]) for med in response.json()["medications"])
+                wrong += read != expected
+            elif enabled and local_expected:
+                # Codes du catalogue non lus : l'image est passée par Gemini
+                missed += 1
+
+        await asyncio.gather(*(upload(*image) for image in images))
+        await client.delete("/medications", params={"session_id": "bench"})
+
+    main_storage.gemini.generate_content = generate
+    main_storage.barcode_pass = barcode_pass
+    main_storage.count_units = count_units
+    return latencies, len(calls), wrong, missed
+
+
+def mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--coded", type=float, default=0.7, help="part des photos aux codes du catalogue")
+    parser.add_argument("--unknown", type=float, default=0.1, help="part des photos au code hors catalogue")
+    parser.add_argument("--latency", type=float, default=1.5, help="latence du faux Gemini (s)")
+    parser.add_argument("--count-latency", type=float, default=0.5, help="latence du comptage des unités (s)")
+    parser.add_argument("--count-units", action="store_true", help="unités comptées par Gemini (BARCODE_COUNT_UNITS=1)")
+    parser.add_argument("--concurrency", type=int, default=8, help="envois simultanés")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if not DECODER_AVAILABLE:
+        raise SystemExit("zxing-cpp n'est pas installé (pip install zxing-cpp)")
+
+    from benchmarks import fake_gemini
+    fake_gemini.install(main_storage, latency=args.latency, latency_jitter=0.1, count_latency=args.count_latency)
+    print(f"Génération de {args.images} photos...", flush=True)
+    known, images = build_images(args)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "produits.csv")
+        write_catalog(path, known)
+        main_storage.product_catalog = ProductCatalog.load(path)
+
+    print(f"{'mode':<14} {'total s':>8} {'sans Gemini':>12} {'codes+comptage':>15} {'appels Gemini':>14} "
+          f"{'latence locale s':>17} {'latence comptage s':>19} {'latence Gemini s':>17} {'erronées':>9} {'manquées':>9}")
+    for label, enabled in (("Gemini seul", False), ("codes GS1", True)):
+        start = time.perf_counter()
+        latencies, calls, wrong, missed = asyncio.run(run_scenario(enabled, images, args))
+        total = time.perf_counter() - start
+        local, counted = len(latencies["local"]), len(latencies["count"])
+        print(f"{label:<14} {total:>8.1f} {local / len(images):>12.0%} {counted / len(images):>15.0%} {calls:>14} "
+              f"{mean(latencies['local']):>17.3f} {mean(latencies['count']):>19.3f} {mean(latencies['gemini']):>17.3f} "
+              f"{wrong:>9} {missed:>9}")
+
+
+if __name__ == "__main__":
+    main()
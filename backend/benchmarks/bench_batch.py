@@ -0,0 +1,69 @@
+"""
+Temps total d'un lot de photos : endpoint batch contre envois successifs
+
+    python -m benchmarks.bench_batch --images 50 --latency 1 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from app import main_storage
+from app.services import SERVICE_CONFIG
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+
+def photos(count):
+    # Images distinctes pour ne pas être servies par le cache
+    return [("files", (f"photo{i}.jpg", IMAGE + uuid.uuid4().bytes, "image/jpeg")) for i in range(count)]
+
+
+async def run_sequential(client, count):
+    start = time.perf_counter()
+    for _, (name, data, content_type) in photos(count):
+        response = await client.post("/analyze-medication", params={"session_id": "bench"},
+                                     files={"file": (name, data, content_type)})
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run_batch(client, count):
+    # httpx.ASGITransport met la réponse en mémoire : seul le temps total est mesuré ici
+    start = time.perf_counter()
+    response = await client.post("/analyze-medications/batch", params={"session_id": "bench"}, files=photos(count))
+    response.raise_for_status()
+    summary = json.loads(response.text.splitlines()[-1])
+    assert summary["succeeded"] == count, summary
+    return time.perf_counter() - start
+
+
+async def run(count, latency, concurrency, sequential):
+    SERVICE_CONFIG["gemini"]["max_concurrency"] = concurrency
+    fake_gemini.install(main_storage, latency=latency)
+    transport = httpx.ASGITransport(app=main_storage.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        elapsed = await run_batch(client, count)
+        print(f"batch      : {count} images en {elapsed:.2f}s")
+        if sequential:
+            elapsed = await run_sequential(client, count)
+            print(f"un par un  : {count} images en {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--no-sequential", dest="sequential", action="store_false")
+    args = parser.parse_args()
+    asyncio.run(run(args.images, args.latency, args.concurrency, args.sequential))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Latence par image avec et sans cascade de modèles (GEMINI_CASCADE)
+
+    python -m benchmarks.bench_cascade --images 200 --fast-latency 0.4 --full-latency 1.5 --hard 0.2
+
+Le faux Gemini a une latence par modèle : --fast-latency pour le modèle
+rapide, --full-latency pour le modèle complet. Une part --hard des images
+est rendue avec une confiance de 0.45 par le modèle rapide, et une part
+--unreadable sans JSON ; le modèle complet les lit toutes. Le rapport donne
+la latence par image, les appels à chaque modèle, la part d'images
+escaladées et l'estimation de latence économisée publiée par /health.
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from app import main_storage
+from app.services.cascade import CascadeStats
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+
+async def run_scenario(cascade, args):
+    cascade_config = main_storage.CASCADE
+    fast_model = cascade_config["fast_model"]
+    model = fake_gemini.install(main_storage, latency=args.full_latency, latency_jitter=0.1, tiers={
+        fast_model: {"latency": args.fast_latency, "low_confidence_rate": args.hard,
+                     "parse_error_rate": args.unreadable},
+    })
+    calls = {}
+    generate = model.generate_content
+
+    def counting_generate(self, contents, **kwargs):
+        calls[self.model_name] = calls.get(self.model_name, 0) + 1
+        return generate(self, contents, **kwargs)
+
+    model.generate_content = counting_generate
+    cascade_config["enabled"] = cascade
+    main_storage.analysis_cache.clear()
+    main_storage.cascade_stats = CascadeStats()
+
+    latencies = []
+    low_confidence = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=main_storage.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def upload(index):
+            nonlocal low_confidence
+            # Même suite d'images dans les deux scénarios, sans réponse servie par le cache
+            image = IMAGE + uuid.UUID(int=index + args.seed * 10 ** 6).bytes
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/analyze-medication", params={"session_id": "bench"},
+                                             files={"file": ("photo.jpg", image, "image/jpeg")})
+                latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            low_confidence += any(med["confiance"] < cascade_config["min_confidence"]
+                                  for med in response.json()["medications"])
+
+        await asyncio.gather(*(upload(index) for index in range(args.images)))
+        await client.delete("/medications", params={"session_id": "bench"})
+
+    model.generate_content = generate
+    latencies.sort()
+    stats = main_storage.cascade_stats.stats()
+    return {
+        "mean": sum(latencies) / len(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "fast_calls": calls.get(fast_model, 0),
+        "full_calls": calls.get(main_storage.MODEL_NAME, 0),
+        "escalation_rate": stats["escalation_rate"],
+        "saved": stats["latency_saved_seconds"],
+        "low_confidence": low_confidence,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="envois simultanés")
+    parser.add_argument("--fast-latency", type=float, default=0.4, help="latence du modèle rapide (s)")
+    parser.add_argument("--full-latency", type=float, default=1.5, help="latence du modèle complet (s)")
+    parser.add_argument("--hard", type=float, default=0.2, help="part des images incertaines pour le modèle rapide")
+    parser.add_argument("--unreadable", type=float, default=0.05, help="part des réponses sans JSON du modèle rapide")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':<16} {'moyenne s':>10} {'p50 s':>7} {'p95 s':>7} {'rapide':>7} {'complet':>8} "
+          f"{'escaladées':>11} {'économisé s':>12} {'résultats < seuil':>18}")
+    for label, cascade in (("modèle complet", False), ("cascade", True)):
+        result = asyncio.run(run_scenario(cascade, args))
+        print(f"{label:<16} {result['mean']:>10.2f} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+              f"{result['fast_calls']:>7} {result['full_calls']:>8} {result['escalation_rate']:>11.0%} "
+              f"{result['saved']:>12.1f} {result['low_confidence']:>18}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Envois par minute de quota : regroupement des appels Gemini activé ou non
+
+    python -m benchmarks.bench_coalescing --rate 20 --duration 15 --latency 1 --quota-rpm 15
+
+Les envois arrivent selon un processus de Poisson (--rate par seconde).
+Le quota Gemini est compté en requêtes par minute : le rapport donne le
+nombre d'appels réellement envoyés et le nombre d'envois traités par
+minute de quota consommée.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import httpx
+
+from app import main_storage
+from app.services.coalescer import RequestCoalescer
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+
+async def upload(client, latencies):
+    # Image distincte pour ne pas être servie par le cache
+    files = {"file": ("photo.jpg", IMAGE + uuid.uuid4().bytes, "image/jpeg")}
+    start = time.perf_counter()
+    response = await client.post("/analyze-medication", params={"session_id": "bench"}, files=files)
+    response.raise_for_status()
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_scenario(window, max_batch, args):
+    random.seed(args.seed)
+    model = fake_gemini.install(main_storage, latency=args.latency, latency_jitter=0.1)
+    main_storage.analysis_cache.clear()
+    main_storage.coalescer = RequestCoalescer(main_storage.call_model_batch, window=window,
+                                              max_batch=max_batch) if window > 0 else None
+
+    latencies = []
+    transport = httpx.ASGITransport(app=main_storage.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        tasks = []
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(upload(client, latencies)))
+            await asyncio.sleep(random.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+        await client.delete("/medications", params={"session_id": "bench"})
+
+    latencies.sort()
+    uploads = len(latencies)
+    return {
+        "uploads": uploads,
+        "calls": model.calls,
+        "per_quota_minute": uploads / model.calls * args.quota_rpm,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20.0, help="envois par seconde (moyenne)")
+    parser.add_argument("--duration", type=float, default=15.0, help="durée de l'arrivée des envois en secondes")
+    parser.add_argument("--latency", type=float, default=1.0, help="latence d'un appel Gemini à une image")
+    parser.add_argument("--quota-rpm", type=int, default=15, help="quota Gemini en requêtes par minute")
+    parser.add_argument("--window-ms", type=float, default=50.0, help="fenêtre de regroupement")
+    parser.add_argument("--max-batch", type=int, default=4, help="images maximum par appel groupé")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':<24} {'envois':>7} {'appels':>7} {'envois/min quota':>17} {'p50 s':>7} {'p95 s':>7}")
+    scenarios = [("sans regroupement", 0, 1),
+                 (f"regroupé {args.window_ms:g} ms x{args.max_batch}", args.window_ms / 1000, args.max_batch)]
+    for label, window, max_batch in scenarios:
+        result = asyncio.run(run_scenario(window, max_batch, args))
+        print(f"{label:<24} {result['uploads']:>7} {result['calls']:>7} {result['per_quota_minute']:>17.1f} "
+              f"{result['p50']:>7.2f} {result['p95']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
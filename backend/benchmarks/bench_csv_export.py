@@ -0,0 +1,70 @@
+"""
+Export CSV : concaténation de chaînes (ancienne version) contre export par blocs
+
+    python -m benchmarks.bench_csv_export --rows 10000 100000 300000
+
+Mesure le temps total, le temps jusqu'au premier bloc et le pic mémoire
+(tracemalloc) pour une session de N lignes.
+"""
+
+import argparse
+import time
+import tracemalloc
+import uuid
+
+from app.main_storage import MedicationInfo, iter_csv
+from app.services.storage import MedicationStore
+
+
+def legacy_export(session_meds):
+    csv_content = "Nom,Laboratoire,Date péremption,Numéro de lot,Unités,Confiance (%),Horodatage\n"
+    for med in session_meds:
+        csv_content += f'"{med.nom}","{med.laboratoire}","{med.date_peremption}","{med.numero_lot}",{med.nombre_unites},{round(med.confiance * 100)},"{med.timestamp}"\n'
+    yield csv_content.encode("utf-8")
+
+
+def measure(make_chunks):
+    """Temps mesurés sans tracemalloc, pic mémoire sur une seconde passe"""
+    start = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in make_chunks():
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for chunk in make_chunks():
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, first, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 300000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        store = MedicationStore(MedicationInfo)
+        store.add_many("bench", [
+            MedicationInfo(id=str(uuid.uuid4()), nom=f"Doliprane {i} mg", laboratoire="Sanofi",
+                           date_peremption="12/03/2027", numero_lot=f"LOT{i}", nombre_unites=8,
+                           confiance=0.9, timestamp="2025-01-15T10:30:00", session_id="bench")
+            for i in range(rows)
+        ])
+        print(f"{rows} lignes")
+        for label, chunks in [
+            ("concaténation", lambda: legacy_export(store.list("bench"))),
+            ("par blocs", lambda: iter_csv(store.iter_session("bench"))),
+            ("par blocs gzip", lambda: iter_csv(store.iter_session("bench"), compress=True)),
+        ]:
+            elapsed, first, peak, size = measure(chunks)
+            print(f"  {label:<15} total {elapsed * 1000:8.1f} ms | premier bloc {first * 1000:7.2f} ms | "
+                  f"pic mémoire {peak / 1e6:7.2f} Mo | {size / 1e6:6.2f} Mo envoyés")
+
+
+if __name__ == "__main__":
+    main()
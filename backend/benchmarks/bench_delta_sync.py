@@ -0,0 +1,66 @@
+"""
+Volume transféré par un client qui se resynchronise après chaque analyse
+
+    python -m benchmarks.bench_delta_sync --analyses 500 --per-analysis 3
+
+Compare le rechargement complet de GET /medications avec
+GET /medications/changes?since=<dernière version reçue>.
+"""
+
+import argparse
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app import main_storage
+from app.main_storage import MedicationInfo
+
+SESSION = "bench-delta"
+
+
+def analysis(count):
+    return [
+        MedicationInfo(
+            id=str(uuid.uuid4()), nom="Doliprane 1000mg", laboratoire="Sanofi",
+            date_peremption="12/03/2027", numero_lot=f"LOT{i:04d}", nombre_unites=8,
+            confiance=0.9, timestamp="2025-01-15T10:30:00", session_id=SESSION,
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--analyses", type=int, default=500)
+    parser.add_argument("--per-analysis", type=int, default=3)
+    args = parser.parse_args()
+
+    store = main_storage.medications_storage
+    store.clear(SESSION)
+    full_bytes = delta_bytes = 0
+    full_time = delta_time = 0.0
+    version = 0
+    with TestClient(main_storage.app) as client:
+        for _ in range(args.analyses):
+            store.add_many(SESSION, analysis(args.per_analysis))
+
+            start = time.perf_counter()
+            response = client.get("/medications", params={"session_id": SESSION})
+            full_time += time.perf_counter() - start
+            full_bytes += len(response.content)
+
+            start = time.perf_counter()
+            response = client.get("/medications/changes", params={"session_id": SESSION, "since": version})
+            delta_time += time.perf_counter() - start
+            delta_bytes += len(response.content)
+            version = response.json()["version"]
+    store.clear(SESSION)
+
+    print(f"{args.analyses} analyses de {args.per_analysis} médicaments, une synchronisation après chacune")
+    print(f"rechargement complet : {full_bytes / 1e6:>8.2f} Mo, {full_time:>6.2f} s")
+    print(f"delta depuis version : {delta_bytes / 1e6:>8.2f} Mo, {delta_time:>6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
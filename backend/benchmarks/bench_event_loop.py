@@ -0,0 +1,67 @@
+"""
+Latence de GET /medications pendant que N analyses sont en cours
+
+    python -m benchmarks.bench_event_loop --analyses 8 --latency 2
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+from app import main_storage
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+
+async def poll_medications(client, stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/medications", params={"session_id": "bench"})
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+
+async def analyze(client):
+    # Image unique à chaque envoi pour ne pas être servie par le cache
+    files = {"file": ("photo.jpg", IMAGE + uuid.uuid4().bytes, "image/jpeg")}
+    response = await client.post("/analyze-medication", params={"session_id": "bench"}, files=files)
+    response.raise_for_status()
+
+
+async def run(analyses, latency):
+    fake_gemini.install(main_storage, latency=latency)
+    transport = httpx.ASGITransport(app=main_storage.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        stop = asyncio.Event()
+        samples = []
+        poller = asyncio.create_task(poll_medications(client, stop, samples))
+        start = time.perf_counter()
+        await asyncio.gather(*(analyze(client) for _ in range(analyses)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await poller
+
+    samples_ms = sorted(s * 1000 for s in samples)
+    print(f"{analyses} analyses (latence simulée {latency:.2f}s) en {elapsed:.2f}s")
+    print(f"GET /medications pendant les analyses : {len(samples_ms)} requêtes")
+    if samples_ms:
+        p95 = samples_ms[int(0.95 * (len(samples_ms) - 1))]
+        print(f"  médiane {statistics.median(samples_ms):.1f} ms, p95 {p95:.1f} ms, max {samples_ms[-1]:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--analyses", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.analyses, args.latency))
+
+
+if __name__ == "__main__":
+    main()
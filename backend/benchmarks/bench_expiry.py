@@ -0,0 +1,88 @@
+"""
+Requête « périment bientôt » : index des péremptions contre parcours complet
+
+    python -m benchmarks.bench_expiry --rows 1000000 --within-days 30
+
+Les médicaments ont des dates réparties sur trois ans (un quart au format
+MM/YYYY) et sont stockés dans une seule session, le cas le plus défavorable.
+Le parcours complet reproduit ce que faisait le client : lister la session
+puis analyser chaque date.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+from app.main_storage import MedicationInfo
+from app.services.dates import normalize_expiry
+from app.services.storage import MedicationStore, SQLiteMedicationStore
+
+SESSION = "bench"
+
+
+def make_medications(rows):
+    today = date.today()
+    medications = []
+    for i in range(rows):
+        expiry = today + timedelta(days=random.randrange(-60, 3 * 365))
+        text = expiry.strftime("%m/%Y") if i % 4 == 0 else expiry.strftime("%d/%m/%Y")
+        medications.append(MedicationInfo.model_construct(
+            id=str(uuid.uuid4()), nom=f"Médicament {i % 500}", laboratoire="Sanofi", date_peremption=text,
+            numero_lot=f"LOT{i:07d}", nombre_unites=8, confiance=0.9,
+            timestamp="2025-01-15T10:30:00", session_id=SESSION,
+        ))
+    return medications
+
+
+def full_scan(store, until):
+    results = []
+    for medication in store.list(SESSION):
+        expiry, _ = normalize_expiry(medication.date_peremption)
+        if expiry is not None and expiry <= until:
+            results.append(medication)
+    return results
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1000, len(result)
+
+
+def bench_store(name, store, medications, until, repeat):
+    start = time.perf_counter()
+    for offset in range(0, len(medications), 5):
+        store.add_many(SESSION, medications[offset:offset + 5])
+    insert_elapsed = time.perf_counter() - start
+
+    index_ms, found = timed(lambda: store.expiring(SESSION, until), repeat)
+    scan_ms, scanned = timed(lambda: full_scan(store, until), 1)
+    assert found == scanned, (found, scanned)
+    print(f"{name:<8} | insertion {len(medications) / insert_elapsed:>9.0f} lignes/s | "
+          f"{found} résultats | index {index_ms:>8.2f} ms | parcours complet {scan_ms:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--within-days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    medications = make_medications(args.rows)
+    until = date.today() + timedelta(days=args.within_days)
+    bench_store("mémoire", MedicationStore(MedicationInfo), medications, until, args.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteMedicationStore(os.path.join(directory, "bench.db"), MedicationInfo)
+        bench_store("sqlite", store, medications, until, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
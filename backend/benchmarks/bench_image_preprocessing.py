@@ -0,0 +1,74 @@
+"""
+Taille envoyée à Gemini et latence de bout en bout selon la résolution
+
+    python -m benchmarks.bench_image_preprocessing --bandwidth 1.5
+
+Compare l'envoi de la photo brute et l'envoi après prétraitement, avec un
+faux modèle dont la latence inclut le temps d'upload de l'image (en Mo/s).
+"""
+
+import argparse
+import asyncio
+import io
+import time
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from app import main_storage
+from app.services import SERVICE_CONFIG
+from benchmarks import fake_gemini
+
+RESOLUTIONS = [(1280, 960), (2016, 1512), (3024, 4032), (4000, 3000), (6000, 4000)]
+
+
+def synthetic_photo(width, height, seed):
+    """Photo JPEG qualité téléphone : dégradé et bruit, pour une taille réaliste"""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = gradient + rng.normal(0, 24, (height, width, 3))
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=92)
+    return output.getvalue()
+
+
+async def analyze_once(client, photo):
+    files = {"file": ("photo.jpg", photo, "image/jpeg")}
+    start = time.perf_counter()
+    response = await client.post("/analyze-medication", params={"session_id": "bench"}, files=files)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(bandwidth, latency):
+    fake_gemini.install(main_storage, latency=latency, upload_bytes_per_second=bandwidth * 1_000_000)
+    main_storage.analysis_cache.max_entries = 0
+    transport = httpx.ASGITransport(app=main_storage.app)
+    print(f"{'résolution':>11} | {'brut':>9} {'e2e':>7} | {'prétraité':>9} {'e2e':>7}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for seed, (width, height) in enumerate(RESOLUTIONS):
+            photo = synthetic_photo(width, height, seed)
+            results = []
+            for preprocess in (False, True):
+                SERVICE_CONFIG["image"]["preprocess"] = preprocess
+                before = main_storage.preprocessing_stats["bytes_out"]
+                elapsed = await analyze_once(client, photo)
+                sent = main_storage.preprocessing_stats["bytes_out"] - before if preprocess else len(photo)
+                results.append((sent, elapsed))
+            (raw_size, raw_time), (small_size, small_time) = results
+            print(f"{width:>5}x{height:<5} | {raw_size / 1e6:>7.2f}Mo {raw_time:>6.2f}s | "
+                  f"{small_size / 1e6:>7.2f}Mo {small_time:>6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bandwidth", type=float, default=1.5, help="débit montant simulé en Mo/s")
+    parser.add_argument("--latency", type=float, default=0.5, help="latence fixe du modèle en secondes")
+    args = parser.parse_args()
+    asyncio.run(run(args.bandwidth, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Coût d'un rafraîchissement de GET /medications sur une grosse session
+
+    python -m benchmarks.bench_list_polling --rows 10000 --polls 50
+
+Compare la liste complète, une réponse 304 (ETag inchangé), une page de
+--limit médicaments et une page réduite aux champs --fields.
+"""
+
+import argparse
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app import main_storage
+from app.main_storage import MedicationInfo
+
+SESSION = "bench"
+
+
+def fill(rows):
+    main_storage.medications_storage.clear(SESSION)
+    for offset in range(0, rows, 500):
+        main_storage.medications_storage.add_many(SESSION, [
+            MedicationInfo(
+                id=str(uuid.uuid4()), nom=f"Médicament {i}", laboratoire="Sanofi",
+                date_peremption="12/03/2027", numero_lot=f"LOT{i:06d}", nombre_unites=8,
+                confiance=0.9, timestamp="2025-01-15T10:30:00", session_id=SESSION,
+            )
+            for i in range(offset, min(offset + 500, rows))
+        ])
+
+
+def measure(client, polls, params, headers=None):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for _ in range(polls):
+        response = client.get("/medications", params=dict(params, session_id=SESSION), headers=headers or {})
+    return ((time.process_time() - cpu) / polls * 1000, (time.perf_counter() - wall) / polls * 1000,
+            response.status_code, len(response.content))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--polls", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--fields", default="nom,numero_lot,nombre_unites")
+    args = parser.parse_args()
+
+    fill(args.rows)
+    with TestClient(main_storage.app) as client:
+        etag = client.get("/medications", params={"session_id": SESSION}).headers["etag"]
+        scenarios = [
+            ("liste complète", {}, None),
+            ("304 (ETag inchangé)", {}, {"If-None-Match": etag}),
+            (f"page de {args.limit}", {"limit": args.limit}, None),
+            ("page + champs", {"limit": args.limit, "fields": args.fields}, None),
+            ("liste + champs", {"fields": args.fields}, None),
+        ]
+        print(f"{'scénario':<22} {'statut':>6} {'octets':>10} {'CPU ms':>8} {'durée ms':>9}")
+        for label, params, headers in scenarios:
+            cpu_ms, wall_ms, status, size = measure(client, args.polls, params, headers)
+            print(f"{label:<22} {status:>6} {size:>10} {cpu_ms:>8.2f} {wall_ms:>9.2f}")
+    main_storage.medications_storage.clear(SESSION)
+
+
+if __name__ == "__main__":
+    main()
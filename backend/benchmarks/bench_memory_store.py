@@ -0,0 +1,99 @@
+"""
+Mémoire occupée par le stockage en mémoire : colonnes contre liste de modèles
+
+    python -m benchmarks.bench_memory_store --rows 1000000
+
+Les médicaments arrivent par analyses de --per-analysis boîtes (même
+horodatage), répartis sur --sessions sessions, avec des noms, laboratoires
+et dates qui se répètent comme dans une vraie pharmacie. Chaque
+représentation est mesurée dans un processus séparé : pic de mémoire
+résidente (ru_maxrss) moins celui du processus après les imports.
+"""
+
+import argparse
+import random
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.main_storage import MedicationInfo
+from app.services.storage import MedicationStore
+
+
+class ModelListStore:
+    """Ancienne représentation : une liste de modèles pydantic par session"""
+
+    def __init__(self):
+        self._sessions = {}
+
+    def add_many(self, session_id, medications):
+        self._sessions.setdefault(session_id, []).extend(medications)
+
+    def list(self, session_id):
+        return list(self._sessions.get(session_id, ()))
+
+
+def analyses(rows, per_analysis, sessions, seed):
+    random.seed(seed)
+    names = [f"Médicament {i} {random.choice((250, 500, 1000))}mg" for i in range(500)]
+    laboratories = [f"Laboratoire {i}" for i in range(30)]
+    start = datetime(2025, 1, 15, 8, 0)
+    for offset in range(0, rows, per_analysis):
+        session_id = f"pharmacie-{offset // per_analysis % sessions}"
+        timestamp = (start + timedelta(seconds=offset, microseconds=random.randrange(10 ** 6))).isoformat()
+        yield session_id, [
+            MedicationInfo(
+                id=str(uuid.uuid4()), nom=random.choice(names), laboratoire=random.choice(laboratories),
+                date_peremption=f"{random.randint(1, 28):02d}/{random.randint(1, 12):02d}/{random.randint(2025, 2028)}",
+                numero_lot=f"LOT{random.randrange(20000):05d}", nombre_unites=random.randint(0, 30),
+                confiance=round(random.random(), 2), timestamp=timestamp, session_id=session_id,
+            )
+            for _ in range(min(per_analysis, rows - offset))
+        ]
+
+
+def peak_rss():
+    # ru_maxrss est en kilo-octets sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(label, store, args):
+    baseline = peak_rss()
+    start = time.perf_counter()
+    for session_id, medications in analyses(args.rows, args.per_analysis, args.sessions, args.seed):
+        store.add_many(session_id, medications)
+    insert_elapsed = time.perf_counter() - start
+    used = peak_rss() - baseline
+
+    start = time.perf_counter()
+    for session in range(args.sessions):
+        store.list(f"pharmacie-{session}")
+    list_elapsed = time.perf_counter() - start
+    print(f"{label:<18} {used / 1e6:>9.1f} Mo {used / args.rows:>8.0f} o/ligne | "
+          f"insertion {insert_elapsed:>6.1f} s | lister toutes les sessions {list_elapsed:>6.2f} s", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--per-analysis", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--store", choices=("models", "columns"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.store == "models":
+        measure("liste de modèles", ModelListStore(), args)
+    elif args.store == "columns":
+        measure("colonnes", MedicationStore(MedicationInfo), args)
+    else:
+        for store in ("models", "columns"):
+            subprocess.run([sys.executable, "-m", "benchmarks.bench_memory_store", "--store", store,
+                            *sys.argv[1:]], check=True)
+
+
+if __name__ == "__main__":
+    main()
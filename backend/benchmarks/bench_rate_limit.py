@@ -0,0 +1,103 @@
+"""
+Débit utile sous surcharge face à un quota Gemini simulé
+
+    python -m benchmarks.bench_rate_limit --quota 60 --window 10 --rate 18 --duration 30
+
+Le faux Gemini accepte --quota appels par fenêtre glissante de --window
+secondes et répond 429 au-delà. Les envois arrivent selon un processus de
+Poisson à --rate par seconde, soit plusieurs fois le quota. Chaque
+scénario compare le débit utile (analyses réussies par seconde) au quota.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import httpx
+
+from app import main_storage
+from app.services import SERVICE_CONFIG, gemini
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+SCENARIOS = [
+    ("sans limitation", {"rpm": 0, "max_retries": 0, "adaptive": False}),
+    ("nouveaux essais", {"rpm": 0, "max_retries": 3, "adaptive": False}),
+    ("AIMD + essais", {"rpm": 0, "max_retries": 3, "adaptive": True}),
+    ("seau + AIMD + essais", {"max_retries": 3, "adaptive": True}),
+]
+
+
+async def upload(client, results):
+    files = {"file": ("photo.jpg", IMAGE + uuid.uuid4().bytes, "image/jpeg")}
+    start = time.perf_counter()
+    response = await client.post("/analyze-medication", params={"session_id": "bench"}, files=files)
+    results.append((response.status_code, time.perf_counter() - start))
+
+
+async def run_scenario(settings, args):
+    random.seed(args.seed)
+    gemini.shutdown()
+    SERVICE_CONFIG["gemini"].update(rpm=args.quota * 60 / args.window, burst=args.burst,
+                                    retry_delay=args.retry_delay, max_wait=args.max_wait)
+    SERVICE_CONFIG["gemini"].update(settings)
+    model = fake_gemini.install(main_storage, latency=args.latency, latency_jitter=0.2,
+                                quota=args.quota, quota_window=args.window)
+    main_storage.analysis_cache.clear()
+
+    results = []
+    transport = httpx.ASGITransport(app=main_storage.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        tasks = []
+        deadline = start + args.duration
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(upload(client, results)))
+            await asyncio.sleep(random.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        await client.delete("/medications", params={"session_id": "bench"})
+
+    successes = sorted(latency for status, latency in results if status == 200)
+    return {
+        "offered": len(results),
+        "ok": len(successes),
+        "rejected": sum(1 for status, _ in results if status == 429),
+        "failed": sum(1 for status, _ in results if status not in (200, 429)),
+        "goodput": len(successes) / elapsed,
+        "calls": model.calls,
+        "throttled": model.throttled,
+        "p50": successes[len(successes) // 2] if successes else 0.0,
+        "p95": successes[int(0.95 * (len(successes) - 1))] if successes else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quota", type=int, default=60, help="appels acceptés par fenêtre")
+    parser.add_argument("--window", type=float, default=10.0, help="fenêtre du quota en secondes")
+    parser.add_argument("--rate", type=float, default=18.0, help="envois par seconde (moyenne)")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--latency", type=float, default=0.5, help="latence d'un appel accepté")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--retry-delay", type=float, default=0.5)
+    parser.add_argument("--max-wait", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    quota_rate = args.quota / args.window
+    print(f"quota {quota_rate:.1f} appels/s, charge offerte {args.rate:.1f} envois/s")
+    print(f"{'scénario':<22} {'envois':>7} {'réussis':>8} {'429':>6} {'échecs':>7} {'utile/s':>8} "
+          f"{'% quota':>8} {'appels':>7} {'refusés':>8} {'p50 s':>6} {'p95 s':>6}")
+    for label, settings in SCENARIOS:
+        result = asyncio.run(run_scenario(settings, args))
+        print(f"{label:<22} {result['offered']:>7} {result['ok']:>8} {result['rejected']:>6} {result['failed']:>7} "
+              f"{result['goodput']:>8.2f} {result['goodput'] / quota_rate * 100:>7.0f}% {result['calls']:>7} "
+              f"{result['throttled']:>8} {result['p50']:>6.2f} {result['p95']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
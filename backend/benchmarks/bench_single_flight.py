@@ -0,0 +1,104 @@
+"""
+Envois identiques simultanés : un seul appel au modèle grâce au single-flight
+
+    python -m benchmarks.bench_single_flight --duplicates 8 --latency 1.0
+
+Le faux Gemini répond après --latency secondes. Chaque scénario envoie
+--duplicates fois la même analyse en même temps, puis vérifie le nombre
+d'appels au modèle et de médicaments stockés (le script s'arrête sur une
+AssertionError si le dédoublonnage ne tient pas) :
+- même image, sans en-tête : une analyse partagée ;
+- Idempotency-Key identique, images réencodées (octets différents) ;
+- Idempotency-Key renvoyée après la fin de l'analyse : réponse rejouée ;
+- single-flight désactivé (SINGLE_FLIGHT=0) : un appel par envoi, comme avant.
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from app import main_storage
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 4096
+
+
+async def send(client, count, session_id, images, headers=None):
+    async def one(image):
+        response = await client.post("/analyze-medication", params={"session_id": session_id}, headers=headers,
+                                     files={"file": ("photo.jpg", image, "image/jpeg")})
+        response.raise_for_status()
+        return response.json()["medications"]
+
+    return await asyncio.gather(*(one(images[index % len(images)]) for index in range(count)))
+
+
+async def run_scenario(client, calls, label, count, enabled=True, headers=None, reencode=False, replay=False):
+    main_storage.SERVICE_CONFIG["single_flight"]["enabled"] = enabled
+    main_storage.analysis_cache.clear()
+    session_id = f"bench-{uuid.uuid4().hex[:8]}"
+    seed = uuid.uuid4().bytes
+    # Réencodage simulé : mêmes pixels pour le client, octets différents à chaque envoi
+    images = [IMAGE + seed + bytes([index]) for index in range(count)] if reencode else [IMAGE + seed]
+    before = len(calls)
+    start = time.perf_counter()
+    responses = await send(client, count, session_id, images, headers)
+    if replay:
+        # Le téléphone n'a pas reçu la réponse et renvoie après la fin de l'analyse
+        responses += await send(client, 1, session_id, images, headers)
+    elapsed = time.perf_counter() - start
+    model_calls = len(calls) - before
+    stored = main_storage.medications_storage.count(session_id)
+    ids = {tuple(med["id"] for med in medications) for medications in responses}
+    await client.delete("/medications", params={"session_id": session_id})
+    print(f"{label:<44} {len(responses):>6} {model_calls:>13} {stored:>10} {len(ids):>16} {elapsed:>8.2f}")
+    return model_calls, stored, len(ids), len(responses[0])
+
+
+async def main_async(args):
+    fake_gemini.install(main_storage, latency=args.latency, medications_per_image=3)
+    calls = []
+    generate = main_storage.gemini.generate_content
+
+    async def counting_generate(model, contents, **kwargs):
+        calls.append(model)
+        return await generate(model, contents, **kwargs)
+
+    main_storage.gemini.generate_content = counting_generate
+    count = args.duplicates
+    key = {"Idempotency-Key": str(uuid.uuid4())}
+    print(f"{'scénario':<44} {'envois':>6} {'appels modèle':>13} {'stockés':>10} {'réponses dist.':>16} {'durée s':>8}")
+    transport = httpx.ASGITransport(app=main_storage.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        model_calls, stored, distinct, per_image = await run_scenario(client, calls, "même image", count)
+        assert model_calls == 1 and stored == per_image and distinct == 1, "même image : analyse non partagée"
+
+        model_calls, stored, distinct, per_image = await run_scenario(
+            client, calls, "même Idempotency-Key, images réencodées", count, headers=key, reencode=True)
+        assert model_calls == 1 and stored == per_image and distinct == 1, "Idempotency-Key : analyse non partagée"
+
+        key = {"Idempotency-Key": str(uuid.uuid4())}
+        model_calls, stored, distinct, per_image = await run_scenario(
+            client, calls, "Idempotency-Key, renvoi après la fin", count, headers=key, replay=True)
+        assert model_calls == 1 and stored == per_image and distinct == 1, "Idempotency-Key : réponse non rejouée"
+
+        model_calls, stored, distinct, per_image = await run_scenario(
+            client, calls, "single-flight désactivé", count, enabled=False)
+        assert model_calls == count and stored == count * per_image, "sans single-flight : un appel par envoi attendu"
+    main_storage.gemini.generate_content = generate
+    print("OK : un seul appel au modèle par groupe d'envois identiques")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duplicates", type=int, default=8, help="envois identiques simultanés")
+    parser.add_argument("--latency", type=float, default=1.0, help="latence du faux Gemini (s)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
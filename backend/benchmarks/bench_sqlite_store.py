@@ -0,0 +1,67 @@
+"""
+Débit du stockage SQLite : insertions par analyse et listage d'une session
+
+    python -m benchmarks.bench_sqlite_store --sizes 1000 100000 1000000
+
+Les lignes sont réparties en sessions de --session-size médicaments et
+insérées par lots de --batch (une transaction par analyse).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+from app.main_storage import MedicationInfo
+from app.services.storage import SQLiteMedicationStore
+
+
+def make_batch(session_id, batch, timestamp):
+    return [
+        MedicationInfo(
+            id=str(uuid.uuid4()), nom=f"Médicament {i}", laboratoire="Sanofi",
+            date_peremption="12/03/2027", numero_lot=f"LOT{i:04d}", nombre_unites=8,
+            confiance=0.9, timestamp=timestamp, session_id=session_id,
+        )
+        for i in range(batch)
+    ]
+
+
+def bench_size(rows, batch, session_size, listings):
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteMedicationStore(os.path.join(directory, "bench.db"), MedicationInfo)
+        timestamp = "2025-01-15T10:30:00"
+        start = time.perf_counter()
+        inserted = 0
+        while inserted < rows:
+            session_id = f"session-{inserted // session_size}"
+            count = min(batch, rows - inserted)
+            store.add_many(session_id, make_batch(session_id, count, timestamp))
+            inserted += count
+        insert_elapsed = time.perf_counter() - start
+
+        sessions = max(1, rows // session_size)
+        start = time.perf_counter()
+        for i in range(listings):
+            store.list(f"session-{(i * 7919) % sessions}")
+        list_elapsed = time.perf_counter() - start
+
+    print(f"{rows:>9} lignes | insertion {rows / insert_elapsed:>9.0f} lignes/s "
+          f"({rows / batch / insert_elapsed:>7.0f} analyses/s) | "
+          f"listage session de {min(session_size, rows)} : {list_elapsed / listings * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--batch", type=int, default=5)
+    parser.add_argument("--session-size", type=int, default=200)
+    parser.add_argument("--listings", type=int, default=200)
+    args = parser.parse_args()
+    for rows in args.sizes:
+        bench_size(rows, args.batch, args.session_size, args.listings)
+
+
+if __name__ == "__main__":
+    main()
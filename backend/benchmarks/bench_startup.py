@@ -0,0 +1,113 @@
+"""
+Temps de démarrage à froid : imports par module et première réponse /health
+
+    python -m benchmarks.bench_startup --runs 5
+
+Pour chaque mode (FAST_STARTUP=0 puis 1), l'outil :
+- importe app.main_storage sous `python -X importtime` et affiche ses
+  imports directs les plus coûteux (temps cumulé, regroupés par paquet) ;
+- lance uvicorn dans un nouveau processus et mesure le délai jusqu'à la
+  première réponse 200 de /health (médiane sur --runs démarrages).
+
+Une clé GEMINI_API_KEY factice suffit : aucun appel Gemini n'est fait.
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def environment(fast, warmup=False):
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "bench-startup")
+    env["FAST_STARTUP"] = "1" if fast else "0"
+    env["STARTUP_WARMUP"] = "1" if warmup else "0"
+    return env
+
+
+def import_times(env):
+    """Temps cumulé (µs) des imports directs de app.main_storage, par paquet, et total"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main_storage"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    children = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth == 1:
+            # Les dépendances d'un module sont listées avant lui, un cran plus à droite
+            package = ".".join(name.split(".")[:3]) if name.startswith("app.") else name.split(".")[0]
+            children[package] = children.get(package, 0) + int(cumulative)
+        elif depth == 0:
+            if name == "app.main_storage":
+                return children, int(cumulative)
+            children = {}
+    raise RuntimeError("app.main_storage absent de la sortie -X importtime")
+
+
+def time_to_healthy(env, timeout=60.0):
+    """Secondes entre le lancement d'uvicorn et la première réponse 200 de /health"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main_storage:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.01)
+        raise TimeoutError(f"/health ne répond pas après {timeout:g}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(label, env, runs, top):
+    packages, total = import_times(env)
+    print(f"\n== {label} ==")
+    print(f"import app.main_storage : {total / 1000:.0f} ms")
+    for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {name:<32} {micros / 1000:8.1f} ms")
+    timings = [time_to_healthy(env) for _ in range(runs)]
+    print(f"première réponse /health : médiane {statistics.median(timings):.2f}s "
+          f"(min {min(timings):.2f}s, max {max(timings):.2f}s, {runs} démarrages)")
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="démarrages mesurés par mode")
+    parser.add_argument("--top", type=int, default=12, help="paquets affichés")
+    parser.add_argument("--warmup", action="store_true", help="activer aussi STARTUP_WARMUP")
+    args = parser.parse_args()
+
+    eager = report("FAST_STARTUP=0 (imports au démarrage)", environment(False, args.warmup), args.runs, args.top)
+    lazy = report("FAST_STARTUP=1 (imports différés)", environment(True, args.warmup), args.runs, args.top)
+    print(f"\nGain sur la première réponse : {eager - lazy:.2f}s ({(1 - lazy / eager) * 100:.0f} %)")
+
+
+if __name__ == "__main__":
+    main()
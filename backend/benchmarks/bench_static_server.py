@@ -0,0 +1,150 @@
+"""
+Latence du serveur de l'interface (frontend/https_server.py) avec des clients simultanés
+
+    python -m benchmarks.bench_static_server --clients 20 --requests 20 --slow-clients 1 --stall 2
+
+Chaque serveur (ancien mono-thread, puis nouveau) est lancé en sous-processus
+avec TLS (certificat auto-signé généré par openssl, HTTP simple sans
+openssl). --clients clients chargent chacun --requests fois /index.html
+sur une nouvelle connexion, comme un navigateur qui accepte gzip. Pendant
+ce temps, --slow-clients téléphones sur un mauvais réseau ouvrent une
+connexion et n'envoient rien pendant --stall secondes, en boucle. Le
+rapport donne la latence par requête, les octets reçus et, pour le nouveau
+serveur, la part de 304 quand le navigateur revalide avec son ETag.
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+
+FRONTEND = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "frontend")
+
+
+def self_signed_certificate(directory):
+    """(cert, key) dans directory, ou None si openssl n'est pas disponible"""
+    if shutil.which("openssl") is None:
+        return None
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+                    "-days", "1", "-subj", "/CN=localhost"], check=True, capture_output=True)
+    return cert, key
+
+
+def start_server(legacy, port, certificate):
+    command = [sys.executable, os.path.join(FRONTEND, "https_server.py"), "--port", str(port),
+               "--directory", FRONTEND, "--quiet"]
+    command += ["--legacy"] if legacy else []
+    command += ["--cert", certificate[0], "--key", certificate[1]] if certificate else ["--no-tls"]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise SystemExit(f"Le serveur ne répond pas sur le port {port}")
+
+
+def fetch(port, tls, headers):
+    if tls:
+        connection = HTTPSConnection("127.0.0.1", port, timeout=60, context=ssl._create_unverified_context())
+    else:
+        connection = HTTPConnection("127.0.0.1", port, timeout=60)
+    start = time.perf_counter()
+    try:
+        connection.request("GET", "/index.html", headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        return time.perf_counter() - start, response.status, len(body), response.getheader("ETag")
+    finally:
+        connection.close()
+
+
+def slow_client(port, stall, stop):
+    """Connexion ouverte sans rien envoyer pendant stall secondes, puis fermée"""
+    while not stop.is_set():
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=5):
+                stop.wait(stall)
+        except OSError:
+            stop.wait(0.1)
+
+
+def run(legacy, port, args, certificate):
+    process = start_server(legacy, port, certificate)
+    tls = certificate is not None
+    stop = threading.Event()
+    slow = [threading.Thread(target=slow_client, args=(port, args.stall, stop), daemon=True)
+            for _ in range(args.slow_clients)]
+    try:
+        for thread in slow:
+            thread.start()
+        time.sleep(0.2)
+
+        def client(_):
+            results = []
+            etag = None
+            for _ in range(args.requests):
+                headers = {"Accept-Encoding": "gzip"}
+                if args.revalidate and etag:
+                    headers["If-None-Match"] = etag
+                results.append(fetch(port, tls, headers))
+                etag = results[-1][3] or etag
+            return results
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            results = [result for batch in pool.map(client, range(args.clients)) for result in batch]
+        elapsed = time.perf_counter() - start
+    finally:
+        stop.set()
+        process.terminate()
+        process.wait()
+
+    latencies = sorted(result[0] for result in results)
+    return {
+        "requests_per_second": len(results) / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "max": latencies[-1],
+        "bytes": sum(result[2] for result in results) / len(results),
+        "not_modified": sum(1 for result in results if result[1] == 304) / len(results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=20, help="requêtes par client")
+    parser.add_argument("--slow-clients", type=int, default=1)
+    parser.add_argument("--stall", type=float, default=2.0, help="durée d'une connexion lente (s)")
+    parser.add_argument("--port", type=int, default=3543)
+    parser.add_argument("--no-revalidate", dest="revalidate", action="store_false",
+                        help="sans If-None-Match (cache navigateur vide à chaque requête)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        certificate = self_signed_certificate(directory)
+        print(f"Transport : {'HTTPS' if certificate else 'HTTP (openssl absent)'}, {args.clients} clients, "
+              f"{args.slow_clients} client(s) lent(s) de {args.stall:g} s")
+        print(f"{'serveur':<22} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'octets/req':>11} {'304':>6}")
+        for offset, (label, legacy) in enumerate((("ancien (mono-thread)", True), ("nouveau (threads)", False))):
+            result = run(legacy, args.port + offset, args, certificate)
+            print(f"{label:<22} {result['requests_per_second']:>8.1f} {result['p50'] * 1000:>8.1f} "
+                  f"{result['p95'] * 1000:>8.1f} {result['max'] * 1000:>8.1f} {result['bytes']:>11.0f} "
+                  f"{result['not_modified']:>6.0%}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Lecture du stock consolidé : coût selon le nombre de photos stockées
+
+    python -m benchmarks.bench_stock --rows 10000 100000 1000000 --lines 500
+
+Le nombre de lignes (produit, lot) reste fixe pendant que le nombre de
+photos augmente : la lecture de l'agrégat doit rester constante, à
+comparer avec un regroupement complet de la session.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+from app.main_storage import MedicationInfo
+from app.services.stock import stock_key
+from app.services.storage import MedicationStore, SQLiteMedicationStore
+
+SESSION = "bench"
+
+
+def make_medications(rows, lines):
+    return [
+        MedicationInfo.model_construct(
+            id=str(uuid.uuid4()), nom=f"Médicament {i % lines % 97} {i % lines // 97}mg",
+            laboratoire=f"Labo {i % 13}", date_peremption="12/03/2027", numero_lot=f"LOT{i % lines:04d}",
+            nombre_unites=8, confiance=0.9, timestamp="2025-01-15T10:30:00", session_id=SESSION,
+        )
+        for i in range(rows)
+    ]
+
+
+def regroup(store):
+    groups = {}
+    for medication in store.iter_session(SESSION):
+        key = stock_key(medication.nom, medication.numero_lot)
+        groups[key] = groups.get(key, 0) + medication.nombre_unites
+    return groups
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench(name, store, medications, repeat):
+    for offset in range(0, len(medications), 500):
+        store.add_many(SESSION, medications[offset:offset + 500])
+    stock_ms = timed(lambda: store.stock(SESSION), repeat)
+    regroup_ms = timed(lambda: regroup(store), 1)
+    print(f"{name:<8} {len(medications):>9} photos | agrégat {stock_ms:>7.2f} ms | regroupement complet {regroup_ms:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    for rows in args.rows:
+        medications = make_medications(rows, args.lines)
+        bench("mémoire", MedicationStore(MedicationInfo), medications, args.repeat)
+        with tempfile.TemporaryDirectory() as directory:
+            bench("sqlite", SQLiteMedicationStore(os.path.join(directory, "bench.db"), MedicationInfo),
+                  medications, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
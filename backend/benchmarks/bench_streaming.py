@@ -0,0 +1,67 @@
+"""
+Délai avant le premier médicament : réponse complète contre streaming SSE
+
+    python -m benchmarks.bench_streaming --medications 12 --latency 4
+
+Le faux modèle répartit sa latence sur les morceaux de la réponse, comme
+une génération token par token. Mesuré sur une vraie connexion HTTP.
+"""
+
+import argparse
+import time
+import uuid
+
+import httpx
+
+from app import main_storage
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+
+
+def upload():
+    return {"file": ("photo.jpg", IMAGE + uuid.uuid4().bytes, "image/jpeg")}
+
+
+def measure_full(client):
+    start = time.perf_counter()
+    response = client.post("/analyze-medication", files=upload())
+    response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, len(response.json()["medications"])
+
+
+def measure_stream(client):
+    start = time.perf_counter()
+    first = None
+    count = 0
+    with client.stream("POST", "/analyze-medication/stream", files=upload()) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line == "event: medication":
+                count += 1
+                if first is None:
+                    first = time.perf_counter() - start
+    return first, time.perf_counter() - start, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--medications", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=4.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    fake_gemini.install(main_storage, latency=args.latency, medications_per_image=args.medications)
+    server = fake_gemini.serve_in_thread(main_storage.app, args.port)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=None) as client:
+            for label, measure in (("réponse complète", measure_full), ("streaming SSE", measure_stream)):
+                first, total, count = measure(client)
+                print(f"{label:<17}: premier médicament {first:.2f}s, total {total:.2f}s, {count} médicaments")
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
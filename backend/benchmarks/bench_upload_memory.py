@@ -0,0 +1,143 @@
+"""
+Pic de mémoire du serveur pendant des envois simultanés de grosses photos
+
+    python -m benchmarks.bench_upload_memory --concurrency 16 --size-mb 8
+
+Le serveur (faux Gemini, prétraitement désactivé) tourne dans un processus
+séparé ; --concurrency clients envoient chacun une photo distincte de
+--size-mb Mo en même temps, pendant que le faux modèle garde chaque
+requête ouverte --latency secondes. On compare le pic de mémoire
+résidente du serveur (VmHWM) à celle mesurée après une première requête :
+- lecture complète : file.read() puis base64 + décodage en str (ancien
+  chemin) ;
+- lecture par morceaux : hachage au fil de la lecture, octets bruts
+  transmis au client Gemini.
+Le faux modèle garde la copie que fait le SDK pendant l'appel (après avoir
+redécodé le base64 dans l'ancien chemin).
+
+Au-delà de 1 Mo, Starlette place les fichiers reçus dans un fichier
+temporaire : ces octets ne comptent pas dans la mémoire du processus.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory(pid, field):
+    """Valeur d'un champ de /proc/<pid>/status, en octets"""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def install_legacy_upload(main_storage):
+    """Ancien chemin : lecture en un bloc, empreinte recalculée, base64 en str"""
+    from app.services.uploads import Upload
+
+    async def read_image(file):
+        data = await file.read()
+        return Upload(data, hashlib.sha256(data).hexdigest())
+
+    prepare = main_storage.prepare_image_part
+
+    async def prepare_image_part(image_data, content_type):
+        part = await prepare(image_data, content_type)
+        return {"mime_type": part["mime_type"], "data": base64.b64encode(part["data"]).decode("utf-8")}
+
+    main_storage.read_image = read_image
+    main_storage.prepare_image_part = prepare_image_part
+
+
+def serve(args):
+    import uvicorn
+
+    from app import main_storage
+    from benchmarks import fake_gemini
+
+    fake_gemini.install(main_storage, latency=args.latency, marshal_payload=True)
+    if args.legacy:
+        install_legacy_upload(main_storage)
+    uvicorn.run(main_storage.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+async def upload_all(port, concurrency, size):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+        async def upload(index):
+            # Octets distincts par requête : pas de réponse servie par le cache
+            image = os.urandom(size)
+            response = await client.post("/analyze-medication", params={"session_id": f"bench-{index}"},
+                                         files={"file": (f"photo-{index}.jpg", image, "image/jpeg")})
+            response.raise_for_status()
+
+        await upload(-1)
+        yield
+        start = time.perf_counter()
+        await asyncio.gather(*(upload(index) for index in range(concurrency)))
+        yield time.perf_counter() - start
+
+
+async def measure(label, legacy, args):
+    port = free_port()
+    env = dict(os.environ, GEMINI_API_KEY="bench", IMAGE_PREPROCESS="0",
+               UPLOAD_MAX_BYTES=str(args.size_mb * 2 * 1024 * 1024))
+    command = [sys.executable, "-m", "benchmarks.bench_upload_memory", "--serve", "--port", str(port),
+               "--latency", str(args.latency)]
+    process = subprocess.Popen(command + (["--legacy"] if legacy else []), env=env)
+    try:
+        async with httpx.AsyncClient() as probe:
+            while True:
+                try:
+                    await probe.get(f"http://127.0.0.1:{port}/health")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.05)
+        steps = upload_all(port, args.concurrency, args.size_mb * 1024 * 1024)
+        await steps.__anext__()
+        baseline = memory(process.pid, "VmRSS")
+        elapsed = await steps.__anext__()
+        peak = memory(process.pid, "VmHWM")
+    finally:
+        process.terminate()
+        process.wait()
+    used = peak - baseline
+    print(f"{label:<22} pic {used / 1e6:>7.1f} Mo au-dessus du repos "
+          f"({used / (args.concurrency * args.size_mb * 1024 * 1024):.2f} x les octets reçus) | {elapsed:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=1.0, help="latence du faux modèle en secondes")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--legacy", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+    print(f"{args.concurrency} envois simultanés de {args.size_mb} Mo")
+    asyncio.run(measure("lecture complète", True, args))
+    asyncio.run(measure("lecture par morceaux", False, args))
+
+
+if __name__ == "__main__":
+    main()
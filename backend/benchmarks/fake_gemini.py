@@ -0,0 +1,240 @@
+"""
+Faux client Gemini pour les benchmarks hors ligne
+
+Utilisable dans le processus (install) ou comme serveur local de l'API
+avec Gemini simulé, pour des tests de charge via HTTP :
+    python -m benchmarks.fake_gemini --port 8000 --latency 1.5 --error-rate 0.05
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+DEFAULT_MEDICATION = {
+    "nom": "Doliprane 1000mg",
+    "laboratoire": "Sanofi",
+    "date_peremption": "12/03/2027",
+    "numero_lot": "AB1234",
+    "nombre_unites": 8,
+    "confiance": 0.92,
+}
+
+try:
+    from google.api_core.exceptions import ResourceExhausted as FakeQuotaError
+    from google.api_core.exceptions import ServiceUnavailable as FakeGeminiError
+except ImportError:
+    class FakeGeminiError(Exception):
+        code = 503
+
+    class FakeQuotaError(Exception):
+        code = 429
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def _stream_chunks(text, delay, chunks=16):
+    """Réponse en streaming : la latence est répartie sur les morceaux"""
+    size = max(1, -(-len(text) // chunks))
+    for start in range(0, len(text), size):
+        time.sleep(delay / chunks)
+        yield FakeResponse(text[start:start + size])
+
+
+def _marshal(data):
+    """Octets tels que le SDK les place dans le Blob protobuf"""
+    if isinstance(data, str):
+        # proto-plus redécode les chaînes affectées à un champ bytes
+        data = base64.urlsafe_b64decode(data.encode("utf-8"))
+    return bytes(memoryview(data))
+
+
+def _difficulty(contents):
+    """Valeur dans [0, 1) tirée des octets de la première image"""
+    for part in contents:
+        if isinstance(part, dict):
+            data = part["data"]
+            digest = hashlib.sha256(data.encode("utf-8") if isinstance(data, str) else data).digest()
+            return int.from_bytes(digest[:8], "big") / 2 ** 64
+    return 1.0
+
+
+class FakeModel:
+    """Imite genai.GenerativeModel (appel bloquant).
+
+    - latency, latency_jitter : latence de base et variation relative (uniforme)
+    - upload_bytes_per_second : ajoute le temps d'envoi des octets de l'image
+    - error_rate : proportion d'appels qui lèvent une erreur 503
+    - medications_per_image, response_padding : taille de la réponse
+    - batch_overhead : latence ajoutée par image supplémentaire d'un appel groupé
+    - quota, quota_window : au-delà de quota appels acceptés sur une fenêtre
+      glissante de quota_window secondes, l'appel échoue aussitôt en 429
+    - marshal_payload : garde pendant l'appel une copie des octets de chaque
+      image, comme le SDK qui les recopie dans la requête protobuf (une
+      chaîne base64 y est d'abord redécodée)
+    - tiers : réglages par nom de modèle (cascade) ; "latency" remplace
+      latency, "low_confidence_rate" et "parse_error_rate" donnent la part
+      des images rendues avec une confiance de 0.45 ou sans JSON. La
+      difficulté d'une image dépend de ses octets : la même image est
+      difficile pour tous les modèles qui ont un taux non nul.
+    - count_latency : latence de la consigne de comptage des boîtes lues dans
+      les codes GS1 (latency si None), qui ne génère qu'une courte réponse
+    """
+
+    latency = 1.0
+    latency_jitter = 0.0
+    upload_bytes_per_second = None
+    error_rate = 0.0
+    medications_per_image = 3
+    response_padding = 0
+    batch_overhead = 0.2
+    quota = None
+    quota_window = 60.0
+    marshal_payload = False
+    tiers = {}
+    count_latency = None
+    calls = 0
+    errors = 0
+    throttled = 0
+    _accepted = deque()
+    _lock = threading.Lock()
+
+    def __init__(self, model_name="gemini-1.5-flash", **kwargs):
+        self.model_name = model_name
+        self.tier = self.tiers.get(model_name, {})
+
+    def generate_content(self, contents, **kwargs):
+        cls = type(self)
+        with cls._lock:
+            cls.calls += 1
+            if self.quota:
+                now = time.monotonic()
+                while cls._accepted and cls._accepted[0] <= now - self.quota_window:
+                    cls._accepted.popleft()
+                if len(cls._accepted) >= self.quota:
+                    cls.throttled += 1
+                    raise FakeQuotaError("Faux Gemini : quota épuisé")
+                cls._accepted.append(now)
+        images = sum(1 for part in contents if isinstance(part, dict))
+        if self.marshal_payload:
+            request = [_marshal(part["data"]) for part in contents if isinstance(part, dict)]  # noqa: F841
+        prompt = next((part for part in contents if isinstance(part, str)), "")
+        counting = '"boites"' in prompt
+        latency = self.count_latency if counting and self.count_latency is not None else self.latency
+        delay = self.tier.get("latency", latency) * (1 + random.uniform(-self.latency_jitter, self.latency_jitter))
+        delay *= 1 + self.batch_overhead * max(images - 1, 0)
+        if self.upload_bytes_per_second:
+            payload = sum(len(part["data"]) for part in contents if isinstance(part, dict))
+            delay += payload / self.upload_bytes_per_second
+        delay = max(delay, 0)
+        if self.error_rate and random.random() < self.error_rate:
+            time.sleep(delay)
+            with cls._lock:
+                cls.errors += 1
+            raise FakeGeminiError("Faux Gemini : service indisponible")
+        if counting:
+            # Une entrée par boîte listée dans la consigne ("1. NOM (LABO), lot ...")
+            boxes = len(re.findall(r"^\s*\d+\. ", prompt, re.MULTILINE))
+            time.sleep(delay)
+            return FakeResponse(json.dumps({"boites": [
+                {"nombre_unites": DEFAULT_MEDICATION["nombre_unites"], "confiance": DEFAULT_MEDICATION["confiance"]}
+            ] * boxes, "autres_boites": 0}))
+        difficulty = _difficulty(contents)
+        low_confidence_rate = self.tier.get("low_confidence_rate", 0.0)
+        if images == 1 and difficulty < low_confidence_rate + self.tier.get("parse_error_rate", 0.0) \
+                and difficulty >= low_confidence_rate:
+            time.sleep(delay)
+            return FakeResponse("Je ne parviens pas à lire les emballages sur cette photo.")
+        confidence = 0.45 if images == 1 and difficulty < low_confidence_rate else DEFAULT_MEDICATION["confiance"]
+        medications = [dict(DEFAULT_MEDICATION, numero_lot=f"AB{1000 + i}", confiance=confidence)
+                       for i in range(self.medications_per_image)]
+        if images > 1:
+            payload = {"images": [{"image": number, "medications": medications}
+                                  for number in range(1, images + 1)]}
+        else:
+            payload = {"medications": medications}
+        # Texte autour du JSON, comme les réponses réelles du modèle
+        padding = "x" * self.response_padding
+        text = f"```json\n{json.dumps(payload)}\n```\n{padding}"
+        if kwargs.get("stream"):
+            return _stream_chunks(text, delay)
+        time.sleep(delay)
+        return FakeResponse(text)
+
+
+def install(module, latency=1.0, medications_per_image=3, upload_bytes_per_second=None,
+            latency_jitter=0.0, error_rate=0.0, response_padding=0, quota=None, quota_window=60.0,
+            marshal_payload=False, tiers=None, count_latency=None):
+    """Remplace genai dans le module applicatif par le faux client"""
+    FakeModel.latency = latency
+    FakeModel.latency_jitter = latency_jitter
+    FakeModel.upload_bytes_per_second = upload_bytes_per_second
+    FakeModel.error_rate = error_rate
+    FakeModel.medications_per_image = medications_per_image
+    FakeModel.response_padding = response_padding
+    FakeModel.quota = quota
+    FakeModel.quota_window = quota_window
+    FakeModel.marshal_payload = marshal_payload
+    FakeModel.tiers = tiers or {}
+    FakeModel.count_latency = count_latency
+    FakeModel.calls = 0
+    FakeModel.errors = 0
+    FakeModel.throttled = 0
+    FakeModel._accepted = deque()
+    module.genai = SimpleNamespace(GenerativeModel=FakeModel, configure=lambda **kwargs: None)
+    module.GEMINI_AVAILABLE = True
+    return FakeModel
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=1.0, help="latence du modèle en secondes")
+    parser.add_argument("--latency-jitter", type=float, default=0.2, help="variation relative de la latence")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="proportion d'appels en erreur 503")
+    parser.add_argument("--medications", type=int, default=3, help="médicaments par réponse")
+    parser.add_argument("--response-padding", type=int, default=0, help="octets de texte ajoutés à la réponse")
+    parser.add_argument("--quota-rpm", type=int, default=None, help="quota simulé en appels par minute (429 au-delà)")
+
+
+def install_from_args(module, args):
+    return install(module, latency=args.latency, latency_jitter=args.latency_jitter, error_rate=args.error_rate,
+                   medications_per_image=args.medications, response_padding=args.response_padding,
+                   quota=args.quota_rpm)
+
+
+def serve_in_thread(app, port):
+    """Lance uvicorn dans un thread (pour mesurer le streaming sur une vraie connexion)"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def main():
+    import uvicorn
+
+    from app import main_storage
+
+    parser = argparse.ArgumentParser(description="API PharmStock avec Gemini simulé")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    install_from_args(main_storage, args)
+    uvicorn.run(main_storage.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Test de charge hors ligne de l'API avec Gemini simulé
+
+    python -m benchmarks.load_test --concurrency 32 --duration 20 --output results.json
+    python -m benchmarks.load_test --compare results_avant.json results.json
+
+Par défaut l'application tourne dans le processus (httpx.ASGITransport).
+Avec --url, la charge est envoyée à un serveur déjà lancé, par exemple
+`python -m benchmarks.fake_gemini --port 8000`.
+
+Chaque client virtuel enchaîne des opérations tirées selon --mix parmi
+analyze (POST /analyze-medication), list (GET /medications), export
+(GET /medications/export) et clear (DELETE /medications).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import subprocess
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+from benchmarks import fake_gemini
+
+IMAGE = b"\xff\xd8\xff\xe0" + b"\x00" * 4096
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        name, weight = item.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+async def request(client, operation, session_id):
+    params = {"session_id": session_id}
+    if operation == "analyze":
+        # Image unique pour ne pas mesurer le cache
+        files = {"file": ("photo.jpg", IMAGE + uuid.uuid4().bytes, "image/jpeg")}
+        return await client.post("/analyze-medication", params=params, files=files)
+    if operation == "list":
+        return await client.get("/medications", params=params)
+    if operation == "export":
+        return await client.get("/medications/export", params=params)
+    if operation == "clear":
+        return await client.delete("/medications", params=params)
+    raise ValueError(f"Opération inconnue : {operation}")
+
+
+async def virtual_client(client, mix, sessions, deadline, samples):
+    operations, weights = zip(*mix.items())
+    while time.perf_counter() < deadline:
+        operation = random.choices(operations, weights)[0]
+        session_id = f"load-{random.randrange(sessions)}"
+        start = time.perf_counter()
+        try:
+            response = await request(client, operation, session_id)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        samples.append((operation, time.perf_counter() - start, status))
+
+
+def is_error(operation, status):
+    # Un export d'une session vide (404) est une réponse attendue
+    if not isinstance(status, int):
+        return True
+    return status >= 400 and not (operation == "export" and status == 404)
+
+
+def summarize(samples, elapsed):
+    by_operation = {}
+    for operation, latency, status in samples:
+        by_operation.setdefault(operation, []).append((latency, is_error(operation, status)))
+    by_operation["total"] = [(latency, is_error(operation, status)) for operation, latency, status in samples]
+
+    report = {}
+    for operation, values in sorted(by_operation.items()):
+        latencies = sorted(latency for latency, _ in values)
+        errors = sum(1 for _, error in values if error)
+        report[operation] = {
+            "requests": len(values),
+            "errors": errors,
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'opération':<10} {'requêtes':>9} {'erreurs':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for operation, stats in report.items():
+        print(f"{operation:<10} {stats['requests']:>9} {stats['errors']:>8} {stats['rps']:>8.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(f"{'opération':<10} {'req/s':>17} {'p95 ms':>21} {'p99 ms':>21}")
+    for operation, stats in after["results"].items():
+        old = before["results"].get(operation)
+        if old is None:
+            continue
+        print(f"{operation:<10} {old['rps']:>7.1f} → {stats['rps']:>7.1f} "
+              f"{old['p95_ms']:>9.1f} → {stats['p95_ms']:>9.1f} {old['p99_ms']:>9.1f} → {stats['p99_ms']:>9.1f}")
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        from app import main_storage
+
+        fake_gemini.install_from_args(main_storage, args)
+        transport = httpx.ASGITransport(app=main_storage.app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=args.timeout)
+
+    samples = []
+    async with client:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(virtual_client(client, mix, args.sessions, deadline, samples)
+                               for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return summarize(samples, elapsed), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="serveur cible (sinon application dans le processus)")
+    parser.add_argument("--concurrency", type=int, default=32, help="clients virtuels simultanés")
+    parser.add_argument("--duration", type=float, default=20.0, help="durée du test en secondes")
+    parser.add_argument("--sessions", type=int, default=20, help="nombre de sessions (pharmacies)")
+    parser.add_argument("--mix", default="analyze=1,list=6,export=1,clear=0.2",
+                        help="poids des opérations analyze, list, export, clear")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"), help="compare deux fichiers de résultats")
+    fake_gemini.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # Les erreurs simulées de Gemini sont comptées dans le rapport
+    logging.getLogger("pharmstock").setLevel(logging.CRITICAL)
+    report, elapsed = asyncio.run(run(args))
+    print_report(report)
+
+    if args.output:
+        config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        document = {
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "config": config,
+            "elapsed_s": elapsed,
+            "results": report,
+        }
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+        print(f"Résultats enregistrés dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,37 @@
 #!/usr/bin/env python3
+"""
+Serveur HTTPS de l'interface mobile
+
+    python3 https_server.py                 # threads, fichiers précompressés, en-têtes de cache
+    python3 https_server.py --legacy        # ancien serveur mono-thread, pour comparaison
+    python3 https_server.py --no-tls --port 8080
+
+Les fichiers du dossier sont lus et compressés (gzip, et brotli si le module
+est installé) une seule fois au démarrage : relancer le serveur après une
+mise à jour de l'interface. Les fichiers cachés, les clés (.pem) et les
+scripts ne sont jamais servis.
+"""
+
+import argparse
+import email.utils
+import gzip
+import hashlib
 import http.server
-import ssl
-import socketserver
+import mimetypes
 import os
+import socketserver
+import ssl
+
+try:
+    import brotli
+except ImportError:  # Brotli optionnel : gzip seul sans le module
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_SIZE = 512
+# Clés TLS et scripts du dossier : jamais servis
+EXCLUDED_SUFFIXES = (".pem", ".py", ".sh")
+
 
 class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def end_headers(self):
@@ -15,16 +44,202 @@ class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_response(200)
         self.end_headers()
 
-PORT = 3443
-Handler = CORSHTTPRequestHandler
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    # Configuration SSL
+class StaticFile:
+    """Contenu d'un fichier et ses variantes compressées, calculés au démarrage"""
+
+    __slots__ = ("data", "content_type", "etag", "mtime", "last_modified", "variants")
+
+    def __init__(self, path):
+        with open(path, "rb") as handle:
+            self.data = handle.read()
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.etag = '"' + hashlib.sha256(self.data).hexdigest()[:32] + '"'
+        self.mtime = int(os.path.getmtime(path))
+        self.last_modified = email.utils.formatdate(self.mtime, usegmt=True)
+        self.variants = {}
+        if len(self.data) >= MIN_COMPRESS_SIZE and self.content_type.startswith(COMPRESSIBLE_TYPES):
+            candidates = {"gzip": gzip.compress(self.data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                candidates["br"] = brotli.compress(self.data, quality=11)
+            # Variante gardée seulement si elle fait gagner au moins 10 %
+            self.variants = {encoding: body for encoding, body in candidates.items()
+                             if len(body) < 0.9 * len(self.data)}
+
+    def select(self, accept_encoding):
+        """(encodage, contenu) selon Accept-Encoding ; brotli préféré à gzip"""
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")
+                    if not part.strip().endswith(";q=0")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return None, self.data
+
+
+def load_files(directory):
+    """Table chemin URL -> StaticFile pour tout le dossier (fichiers cachés, clés et scripts exclus)"""
+    files = {}
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for filename in filenames:
+            if filename.startswith(".") or filename.endswith(EXCLUDED_SUFFIXES):
+                continue
+            path = os.path.join(root, filename)
+            url = "/" + os.path.relpath(path, directory).replace(os.sep, "/")
+            files[url] = StaticFile(path)
+    for url in [url for url in files if url.endswith("/index.html")]:
+        files[url[:-len("index.html")]] = files[url]
+    return files
+
+
+class StaticHandler(CORSHTTPRequestHandler):
+    """Fichiers servis depuis la mémoire, avec ETag, Last-Modified et Cache-Control.
+
+    Le HTML est revalidé à chaque chargement (réponse 304 sans corps s'il n'a
+    pas changé) ; les autres fichiers restent en cache max_age secondes.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Un client lent ou inactif libère son thread au bout de ce délai
+    timeout = 30
+    files = {}
+    max_age = 86400
+
+    def setup(self):
+        super().setup()
+        if isinstance(self.connection, ssl.SSLSocket):
+            # Poignée de main TLS dans le thread du client, pas dans la boucle d'acceptation
+            self.connection.do_handshake()
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_file(head=False)
+
+    def do_HEAD(self):
+        self.send_file(head=True)
+
+    def send_file(self, head):
+        path = self.path.split("?", 1)[0].split("#", 1)[0]
+        static = self.files.get(path)
+        if static is None:
+            self.send_error(404, "Fichier introuvable")
+            return
+
+        cache_control = ("no-cache" if static.content_type == "text/html"
+                         else f"public, max-age={self.max_age}")
+        encoding, body = static.select(self.headers.get("Accept-Encoding", ""))
+        # Une représentation compressée a son propre ETag
+        etag = static.etag if encoding is None else f'{static.etag[:-1]}-{encoding}"'
+        if self.not_modified(static, etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache_control)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", static.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", static.last_modified)
+        self.send_header("Cache-Control", cache_control)
+        if static.variants:
+            self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def not_modified(self, static, etag):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return etag in tags or "*" in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return static.mtime <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class StaticServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # File d'attente du noyau : au-delà, les connexions refusées attendent une seconde avant de réessayer
+    request_queue_size = 128
+    quiet = False
+
+    def handle_error(self, request, client_address):
+        # Client parti ou poignée de main TLS refusée (certificat auto-signé) : rien à tracer
+        pass
+
+
+def tls_context(cert, key):
     context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    context.load_cert_chain('cert.pem', 'key.pem')
-    httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
-    
-    print(f"🔒 Serveur HTTPS démarré sur port {PORT}")
-    print(f"📱 URL mobile : https://192.168.1.36:{PORT}")
-    print("⚠️  Acceptez le certificat auto-signé sur mobile")
-    httpd.serve_forever()
+    context.load_cert_chain(cert, key)
+    return context
+
+
+class LegacyServer(socketserver.TCPServer):
+    # Redémarrage possible sans attendre la fin des connexions en TIME_WAIT
+    allow_reuse_address = True
+
+
+def serve_legacy(args):
+    with LegacyServer(("", args.port), CORSHTTPRequestHandler) as httpd:
+        if not args.no_tls:
+            httpd.socket = tls_context(args.cert, args.key).wrap_socket(httpd.socket, server_side=True)
+        print(f"🔒 Serveur {'HTTP' if args.no_tls else 'HTTPS'} (mono-thread) démarré sur port {args.port}")
+        httpd.serve_forever()
+
+
+def serve(args):
+    StaticHandler.files = load_files(args.directory)
+    StaticHandler.max_age = args.max_age
+    with StaticServer(("", args.port), StaticHandler) as httpd:
+        httpd.quiet = args.quiet
+        if not args.no_tls:
+            httpd.socket = tls_context(args.cert, args.key).wrap_socket(
+                httpd.socket, server_side=True, do_handshake_on_connect=False)
+        compressed = sum(1 for url, static in StaticHandler.files.items() if static.variants and not url.endswith("/"))
+        encodings = "brotli et gzip" if brotli is not None else "gzip"
+        print(f"🔒 Serveur {'HTTP' if args.no_tls else 'HTTPS'} démarré sur port {args.port}")
+        loaded = sum(1 for url in StaticHandler.files if not url.endswith("/"))
+        print(f"📦 {loaded} fichiers en mémoire, {compressed} précompressés ({encodings})")
+        print(f"📱 URL mobile : https://192.168.1.36:{args.port}")
+        print("⚠️  Acceptez le certificat auto-signé sur mobile")
+        httpd.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=3443)
+    parser.add_argument("--directory", default=os.getcwd(), help="dossier servi (défaut : dossier courant)")
+    parser.add_argument("--cert", default="cert.pem")
+    parser.add_argument("--key", default="key.pem")
+    parser.add_argument("--no-tls", action="store_true", help="HTTP simple, pour les tests locaux")
+    parser.add_argument("--max-age", type=int, default=86400, help="durée de cache des fichiers hors HTML (s)")
+    parser.add_argument("--legacy", action="store_true", help="ancien serveur mono-thread sans cache")
+    parser.add_argument("--quiet", action="store_true", help="sans journal des requêtes")
+    args = parser.parse_args()
+    args.cert, args.key = os.path.abspath(args.cert), os.path.abspath(args.key)
+    if args.legacy:
+        os.chdir(args.directory)
+        serve_legacy(args)
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()